@@ -0,0 +1,23 @@
+"""
+Shared JSON report writer for the security test scripts
+
+Each script runs with this directory on sys.path, so it can be imported as
+`from _report import write_json_report`.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def write_json_report(path, report):
+    """Write an indented UTF-8 JSON report, using orjson's encoder when it is installed
+
+    Non-ASCII text is written as-is in both branches, matching orjson's output.
+    """
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    else:
+        path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
@@ -7,31 +7,50 @@ This script runs all security tests and generates a comprehensive report.
 
 import subprocess
 import sys
+import threading
 import time
-import json
 from pathlib import Path
 
-def run_security_test(test_script):
-    """Run a single security test script"""
+from _report import write_json_report
+
+# Wall-clock budget for each script, counted from its start
+TEST_TIMEOUT_SECONDS = 300
+
+# Scripts that never touch the agent socket. The agent serves one client at a
+# time, so only these may run alongside the socket tests, which run one
+# after another
+FILESYSTEM_ONLY_TESTS = frozenset((
+    "tests/security/test_permissions.py",
+    "tests/security/test_audit_logging.py",
+))
+
+def start_security_test(test_script):
+    """Launch a single security test script without waiting for it"""
     print(f"\n🔍 Running {test_script}...")
     
+    return subprocess.Popen(
+        [sys.executable, test_script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+
+def collect_security_test(test_script, process, deadline):
+    """Wait for a launched security test script and build its result"""
     try:
-        result = subprocess.run(
-            [sys.executable, test_script],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
-        )
+        stdout, stderr = process.communicate(timeout=max(0, deadline - time.monotonic()))
         
         return {
             'script': test_script,
-            'exit_code': result.returncode,
-            'stdout': result.stdout,
-            'stderr': result.stderr,
-            'success': result.returncode == 0
+            'exit_code': process.returncode,
+            'stdout': stdout,
+            'stderr': stderr,
+            'success': process.returncode == 0
         }
         
     except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
         return {
             'script': test_script,
             'exit_code': -1,
@@ -46,6 +65,38 @@ def run_security_test(test_script):
             'success': False
         }
 
+def launch_security_test(test_script):
+    """Start a script; return (process or the error that kept it from starting, deadline)"""
+    try:
+        return start_security_test(test_script), time.monotonic() + TEST_TIMEOUT_SECONDS
+    except Exception as e:
+        return e, None
+
+def collect_result(test_script, launched):
+    """Wait for a script started by launch_security_test and build its result"""
+    process, deadline = launched
+    if isinstance(process, Exception):
+        return {
+            'script': test_script,
+            'exit_code': -1,
+            'error': str(process),
+            'success': False
+        }
+    return collect_security_test(test_script, process, deadline)
+
+def collect_in_background(test_script, launched, results):
+    """Wait for a launched script on its own thread, storing its result in results
+    
+    The thread drains the script's pipes while it runs, so its timeout only
+    ever applies to a script that is still running.
+    """
+    def collect():
+        results[test_script] = collect_result(test_script, launched)
+        
+    collector = threading.Thread(target=collect, daemon=True)
+    collector.start()
+    return collector
+
 def main():
     """Main test runner"""
     print("🛡️ Starting Comprehensive Security Test Suite...")
@@ -68,18 +119,26 @@ def main():
     test_results = []
     start_time = time.time()
     
-    for test_script in security_tests:
-        if Path(test_script).exists():
-            result = run_security_test(test_script)
-            test_results.append(result)
+    # Start the filesystem-only scripts in the background, then run the
+    # socket scripts one at a time so they never compete for the agent
+    present = [t for t in security_tests if Path(t).exists()]
+    results = {}
+    collectors = [
+        collect_in_background(t, launch_security_test(t), results)
+        for t in present if t in FILESYSTEM_ONLY_TESTS
+    ]
+    
+    for test_script in present:
+        if test_script not in FILESYSTEM_ONLY_TESTS:
+            results[test_script] = collect_result(test_script, launch_security_test(test_script))
             
-            if result['success']:
-                print(f"   ✅ {test_script} - PASSED")
-            else:
-                print(f"   ❌ {test_script} - FAILED")
-                if 'stderr' in result and result['stderr']:
-                    print(f"      Error: {result['stderr'][:200]}...")
-        else:
+    for collector in collectors:
+        collector.join()
+        
+    # Report in the declared order
+    for test_script in security_tests:
+        result = results.get(test_script)
+        if result is None:
             print(f"   ⚠️  {test_script} - NOT FOUND")
             test_results.append({
                 'script': test_script,
@@ -87,7 +146,17 @@ def main():
                 'error': 'Test script not found',
                 'success': False
             })
+            continue
             
+        test_results.append(result)
+        
+        if result['success']:
+            print(f"   ✅ {test_script} - PASSED")
+        else:
+            print(f"   ❌ {test_script} - FAILED")
+            if 'stderr' in result and result['stderr']:
+                print(f"      Error: {result['stderr'][:200]}...")
+                
     end_time = time.time()
     
     # Generate summary report
@@ -109,8 +178,7 @@ def main():
     }
     
     # Save summary report
-    with open(reports_dir / "security_test_summary.json", "w") as f:
-        json.dump(summary_report, f, indent=2)
+    write_json_report(reports_dir / "security_test_summary.json", summary_report)
         
     # Print final summary
     print(f"\n📊 Security Test Suite Summary:")
@@ -12,81 +12,215 @@ This script tests socket directory permissions to ensure:
 import os
 import stat
 import tempfile
-import shutil
-import json
 import time
 import sys
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from _report import write_json_report
+
+# Directory handle only usable as a dir_fd anchor (Linux); plain read-only elsewhere
+_DIR_FD_FLAGS = getattr(os, 'O_PATH', os.O_RDONLY) | os.O_DIRECTORY
+
+# How long the race test keeps sampling permissions once the chmod is released
+RACE_SAMPLE_BUDGET_NS = 20_000_000  # 20ms
+
+# How long the race test waits for its chmod worker before reporting an error
+RACE_WORKER_TIMEOUT_S = 5.0
+
+def _touch(path, data=b"test", dir_fd=None):
+    """Create (or truncate) a file and write data, with open(path, 'w')'s 0o666-minus-umask mode"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666, dir_fd=dir_fd)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+def _perm_bits(path):
+    """Return a path's permission bits as an integer, e.g. 0o644"""
+    return os.stat(path).st_mode & 0o777
+
+def _remove_tree(path):
+    """Remove a directory tree bottom-up in one os.fwalk pass, ignoring errors
+    
+    Entries are removed relative to their directory's fd rather than by full
+    path.  fwalk lists symlinks to directories (such as the symlink test's
+    link to /etc) under dirnames without descending into them, so those are
+    unlinked rather than removed as directories.
+    """
+    try:
+        for _, dirnames, filenames, dir_fd in os.fwalk(path, topdown=False):
+            for name in filenames:
+                try:
+                    os.unlink(name, dir_fd=dir_fd)
+                except OSError:
+                    pass
+            for name in dirnames:
+                try:
+                    if stat.S_ISLNK(os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_mode):
+                        os.unlink(name, dir_fd=dir_fd)
+                    else:
+                        os.rmdir(name, dir_fd=dir_fd)
+                except OSError:
+                    pass
+        os.rmdir(path)
+    except OSError:
+        pass  # Includes a path that no longer exists
+
+class _CachedStat:
+    """One lstat() of a path, with the fields the checks read exposed as properties
+    
+    Like os.DirEntry, every check reads the same result, so adding a check never
+    adds another stat call.  A relative path may be resolved against dir_fd.
+    """
+    __slots__ = ('path', '_st')
+    
+    def __init__(self, path, dir_fd=None):
+        self.path = path
+        self._st = os.stat(path, dir_fd=dir_fd, follow_symlinks=False)
+        
+    @property
+    def mode(self):
+        """Permission bits, e.g. 0o644"""
+        return self._st.st_mode & 0o777
+        
+    @property
+    def uid(self):
+        return self._st.st_uid
+        
+    @property
+    def gid(self):
+        return self._st.st_gid
+        
+    @property
+    def is_symlink(self):
+        return stat.S_ISLNK(self._st.st_mode)
 
 class PermissionSecurityTester:
     def __init__(self):
         self.test_results = []
         self.failures = 0
         self.temp_dirs = []
+        # Every test gets a subdirectory of one private root, created on first use
+        self.temp_root = None
+        self._dir_fds = []
+        # Tests run concurrently and share the fields above
+        self._state_lock = threading.Lock()
+        # Each test records into its own list, merged in declared order afterwards
+        self._local = threading.local()
+        
+    def _open_dir_fd(self, path):
+        """Open a directory handle for dir_fd-relative calls; cleanup() closes it
+        
+        Names resolved against it skip re-walking every component of the
+        absolute path (and the permission checks on each) per call.
+        """
+        dir_fd = os.open(path, _DIR_FD_FLAGS)
+        with self._state_lock:
+            self._dir_fds.append(dir_fd)
+        return dir_fd
+        
+    def _make_temp_dir(self, name):
+        """Create a per-test directory under the temporary root that cleanup() will remove"""
+        with self._state_lock:
+            if self.temp_root is None:
+                self.temp_root = tempfile.mkdtemp(prefix="quickshell_perm_tests_")
+                self.temp_dirs.append(self.temp_root)
+            temp_dir = os.path.join(self.temp_root, name)
+        os.mkdir(temp_dir)
+        return temp_dir
+        
+    def _add_result(self, result):
+        """Record a test result in the running test's own list"""
+        self._local.results.append(result)
+            
+    def _collect_results(self, test):
+        """Run one test on the calling thread and return the results it recorded"""
+        self._local.results = []
+        try:
+            test()
+            return self._local.results
+        finally:
+            del self._local.results
+            
+    def _count_failure(self):
+        """Count a failure from any test"""
+        with self._state_lock:
+            self.failures += 1
         
     def cleanup(self):
         """Clean up temporary directories"""
+        while self._dir_fds:
+            os.close(self._dir_fds.pop())
+            
+        # _remove_tree already tolerates a missing directory
         for temp_dir in self.temp_dirs:
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            _remove_tree(temp_dir)
                 
     def test_socket_directory_permissions(self):
         """Test socket directory permission security"""
         print("🔒 Testing socket directory permissions...")
         
         # Test 1: Check if socket directory prevents world-write
-        test_dir = tempfile.mkdtemp(prefix="quickshell_perm_test_")
-        self.temp_dirs.append(test_dir)
+        test_dir = self._make_temp_dir("socket_dir")
         
         try:
             # Make directory world-writable (insecure)
             os.chmod(test_dir, 0o777)
-            perms = oct(os.stat(test_dir).st_mode)[-3:]
+            perm_bits = _perm_bits(test_dir)
             
             result = {
                 'test': 'Socket directory world-writable check',
                 'directory': test_dir,
-                'permissions': perms,
-                'status': 'FAIL' if perms == '777' else 'PASS',
+                'permissions': f"{perm_bits:03o}",
+                'mode_bits': perm_bits,
+                'status': 'FAIL' if perm_bits == 0o777 else 'PASS',
                 'description': 'Directory should not be world-writable'
             }
             
-            if perms == '777':
+            if perm_bits == 0o777:
                 result['security_issue'] = 'World-writable socket directory allows privilege escalation'
                 # This is expected behavior - we're testing that we can detect this issue
                 result['test_validates_detection'] = True
                 
-            self.test_results.append(result)
+            self._add_result(result)
             
         except Exception as e:
-            self.test_results.append({
+            self._add_result({
                 'test': 'Socket directory world-writable check',
                 'status': 'ERROR',
                 'error': str(e)
             })
-            self.failures += 1
+            self._count_failure()
             
     def test_symlink_attacks(self):
         """Test protection against symlink attacks"""
         print("🔗 Testing symlink attack prevention...")
         
         # Create test directories
-        attack_dir = tempfile.mkdtemp(prefix="quickshell_symlink_test_")
-        target_dir = tempfile.mkdtemp(prefix="quickshell_target_")
-        self.temp_dirs.extend([attack_dir, target_dir])
+        attack_dir = self._make_temp_dir("symlink")
+        target_dir = self._make_temp_dir("symlink_target")
+        attack_fd = self._open_dir_fd(attack_dir)
         
         try:
             # Test 1: Symlink to sensitive directory
             sensitive_target = "/etc"
-            symlink_path = os.path.join(attack_dir, "malicious_socket")
+            symlink_path = f"{attack_dir}/malicious_socket"
             
+            # lstat never follows links, so the check itself cannot be redirected
+            try:
+                target_stat = os.lstat(sensitive_target)
+            except FileNotFoundError:
+                target_stat = None
+                
             # Create symlink pointing to sensitive location
-            if os.path.exists(sensitive_target):
-                os.symlink(sensitive_target, symlink_path)
+            if target_stat is not None:
+                os.symlink(sensitive_target, "malicious_socket", dir_fd=attack_fd)
                 
                 # Check if symlink exists
-                is_symlink = os.path.islink(symlink_path)
-                target = os.readlink(symlink_path) if is_symlink else None
+                is_symlink = _CachedStat("malicious_socket", dir_fd=attack_fd).is_symlink
+                target = os.readlink("malicious_socket", dir_fd=attack_fd) if is_symlink else None
                 
                 result = {
                     'test': 'Symlink to sensitive directory',
@@ -100,23 +234,23 @@ class PermissionSecurityTester:
                 if is_symlink and target == sensitive_target:
                     result['security_issue'] = 'Symlink attack vector detected'
                     
-                self.test_results.append(result)
+                self._add_result(result)
                 
             # Test 2: Symlink directory traversal
-            traversal_link = os.path.join(attack_dir, "traversal")
-            os.symlink("../../", traversal_link)
+            traversal_link = f"{attack_dir}/traversal"
+            os.symlink("../../", "traversal", dir_fd=attack_fd)
             
             traversal_result = {
                 'test': 'Directory traversal symlink',
                 'symlink_path': traversal_link,
-                'target': os.readlink(traversal_link),
+                'target': os.readlink("traversal", dir_fd=attack_fd),
                 'status': 'DETECTED',
                 'description': 'Directory traversal attack via symlink'
             }
-            self.test_results.append(traversal_result)
+            self._add_result(traversal_result)
             
         except Exception as e:
-            self.test_results.append({
+            self._add_result({
                 'test': 'Symlink attack prevention',
                 'status': 'ERROR',
                 'error': str(e)
@@ -126,26 +260,26 @@ class PermissionSecurityTester:
         """Test file ownership and permission security"""
         print("👤 Testing file ownership security...")
         
-        test_dir = tempfile.mkdtemp(prefix="quickshell_ownership_test_")
-        self.temp_dirs.append(test_dir)
+        test_dir = self._make_temp_dir("ownership")
         
         try:
             # Create test socket file
-            socket_file = os.path.join(test_dir, "test_socket")
-            with open(socket_file, 'w') as f:
-                f.write("test")
+            socket_file = f"{test_dir}/test_socket"
+            test_fd = self._open_dir_fd(test_dir)
+            _touch("test_socket", dir_fd=test_fd)
                 
             # Get file stats
-            stat_info = os.stat(socket_file)
-            file_mode = oct(stat_info.st_mode)[-3:]
-            file_uid = stat_info.st_uid
-            file_gid = stat_info.st_gid
+            stat_info = _CachedStat("test_socket", dir_fd=test_fd)
+            file_mode = stat_info.mode
+            file_uid = stat_info.uid
+            file_gid = stat_info.gid
             current_uid = os.getuid()
             
             result = {
                 'test': 'Socket file ownership and permissions',
                 'file_path': socket_file,
-                'permissions': file_mode,
+                'permissions': f"{file_mode:03o}",
+                'mode_bits': file_mode,
                 'owner_uid': file_uid,
                 'owner_gid': file_gid,
                 'current_uid': current_uid,
@@ -156,11 +290,11 @@ class PermissionSecurityTester:
             security_issues = []
             
             # File should not be world-writable
-            if int(file_mode) & 0o002:
+            if file_mode & 0o002:
                 security_issues.append("File is world-writable")
                 
             # File should not be group-writable unless necessary
-            if int(file_mode) & 0o020:
+            if file_mode & 0o020:
                 security_issues.append("File is group-writable")
                 
             # File should be owned by current user
@@ -170,24 +304,24 @@ class PermissionSecurityTester:
             if security_issues:
                 result['status'] = 'FAIL'
                 result['security_issues'] = security_issues
-                self.failures += 1
+                self._count_failure()
                 
-            self.test_results.append(result)
+            self._add_result(result)
             
         except Exception as e:
-            self.test_results.append({
+            self._add_result({
                 'test': 'File ownership security',
                 'status': 'ERROR',
                 'error': str(e)
             })
-            self.failures += 1
+            self._count_failure()
             
     def test_umask_security(self):
         """Test umask security for new files"""
         print("🎭 Testing umask security...")
         
-        test_dir = tempfile.mkdtemp(prefix="quickshell_umask_test_")
-        self.temp_dirs.append(test_dir)
+        test_dir = self._make_temp_dir("umask")
+        test_fd = self._open_dir_fd(test_dir)
         
         try:
             # Save current umask
@@ -199,99 +333,129 @@ class PermissionSecurityTester:
             for test_umask in test_umasks:
                 os.umask(test_umask)
                 
-                # Create a file with this umask
-                test_file = os.path.join(test_dir, f"umask_{test_umask:03o}_test")
-                with open(test_file, 'w') as f:
-                    f.write("test")
+                # Create an empty file with this umask and read its mode from the open fd
+                test_file = f"umask_{test_umask:03o}_test"
+                fd = os.open(test_file, os.O_WRONLY | os.O_CREAT, 0o666, dir_fd=test_fd)
+                try:
+                    file_mode = os.fstat(fd).st_mode & 0o777
+                finally:
+                    os.close(fd)
+                    os.unlink(test_file, dir_fd=test_fd)
                     
                 # Check resulting permissions
-                file_mode = oct(os.stat(test_file).st_mode)[-3:]
-                expected_mode = oct(0o666 & ~test_umask)[-3:]
+                expected_mode = 0o666 & ~test_umask
                 
                 result = {
                     'test': f'Umask security test ({test_umask:03o})',
                     'umask': f"{test_umask:03o}",
-                    'file_permissions': file_mode,
-                    'expected_permissions': expected_mode,
+                    'file_permissions': f"{file_mode:03o}",
+                    'file_mode_bits': file_mode,
+                    'expected_permissions': f"{expected_mode:03o}",
                     'status': 'PASS' if file_mode == expected_mode else 'FAIL'
                 }
                 
                 if file_mode != expected_mode:
                     result['security_issue'] = 'Unexpected file permissions with umask'
-                    self.failures += 1
+                    self._count_failure()
                     
-                self.test_results.append(result)
+                self._add_result(result)
                 
             # Restore original umask
             os.umask(old_umask)
             
         except Exception as e:
-            self.test_results.append({
+            self._add_result({
                 'test': 'Umask security',
                 'status': 'ERROR',
                 'error': str(e)
             })
-            self.failures += 1
+            self._count_failure()
             
     def test_race_condition_permissions(self):
         """Test for race conditions in permission checking"""
         print("🏃 Testing permission race conditions...")
         
-        test_dir = tempfile.mkdtemp(prefix="quickshell_race_test_")
-        self.temp_dirs.append(test_dir)
+        test_dir = self._make_temp_dir("race")
         
         try:
             # Create file with secure permissions
-            race_file = os.path.join(test_dir, "race_test_file")
-            with open(race_file, 'w') as f:
-                f.write("test")
-            os.chmod(race_file, 0o600)  # Owner read/write only
+            race_file = "race_test_file"
+            test_fd = self._open_dir_fd(test_dir)
+            _touch(race_file, dir_fd=test_fd)
+            os.chmod(race_file, 0o600, dir_fd=test_fd)  # Owner read/write only
+            
+            # Sample the already-open inode: fstat skips re-resolving the path on every check
+            race_fd = os.open(race_file, os.O_RDONLY | os.O_NOFOLLOW, dir_fd=test_fd)
             
-            # Simulate race condition by quickly changing permissions
-            import threading
-            import time
+            # Simulate race condition by quickly changing permissions. The
+            # worker is started before sampling, so going live costs one
+            # Event.set() instead of creating a thread mid-measurement
+            race_go = threading.Event()
             
             def permission_changer():
-                time.sleep(0.01)  # Small delay
+                race_go.wait()
                 try:
-                    os.chmod(race_file, 0o666)  # Make world-writable
+                    os.chmod(race_file, 0o666, dir_fd=test_fd)  # Make world-writable
                 except:
                     pass
                     
-            # Start permission change thread
-            thread = threading.Thread(target=permission_changer)
+            thread = threading.Thread(target=permission_changer, daemon=True)
             thread.start()
             
-            # Check permissions multiple times quickly
+            # Check permissions back to back for a fixed time budget, keeping
+            # each permission state seen (None where the check failed) once per change
             permission_checks = []
-            for i in range(10):
+            samples_taken = 0
+            
+            def sample():
                 try:
-                    perms = oct(os.stat(race_file).st_mode)[-3:]
-                    permission_checks.append(perms)
-                    time.sleep(0.005)
+                    perms = os.fstat(race_fd).st_mode & 0o777
                 except:
-                    permission_checks.append("ERROR")
+                    perms = None
+                if not permission_checks or permission_checks[-1] != perms:
+                    permission_checks.append(perms)
                     
-            thread.join()
-            
+            try:
+                # The state before the chmod is released
+                sample()
+                samples_taken += 1
+                
+                # Release the chmod just as sampling begins
+                race_go.set()
+                deadline = time.perf_counter_ns() + RACE_SAMPLE_BUDGET_NS
+                while time.perf_counter_ns() < deadline:
+                    sample()
+                    samples_taken += 1
+                    
+            finally:
+                # Release the worker even if sampling failed, and wait for it
+                # here so it never outlives the test or its directory fd
+                race_go.set()
+                thread.join(RACE_WORKER_TIMEOUT_S)
+                os.close(race_fd)
+                
+            if thread.is_alive():
+                raise TimeoutError(f"chmod worker did not finish within {RACE_WORKER_TIMEOUT_S}s")
+                
             # Analyze results
             unique_perms = set(permission_checks)
             
             result = {
                 'test': 'Permission race condition',
-                'permission_checks': permission_checks,
-                'unique_permissions': list(unique_perms),
+                'samples_taken': samples_taken,
+                'permission_checks': ["ERROR" if p is None else f"{p:03o}" for p in permission_checks],
+                'unique_permissions': ["ERROR" if p is None else f"{p:03o}" for p in unique_perms],
                 'status': 'DETECTED' if len(unique_perms) > 1 else 'PASS',
                 'description': 'Multiple permission states detected during race condition'
             }
             
-            if len(unique_perms) > 1 and '666' in unique_perms:
+            if len(unique_perms) > 1 and 0o666 in unique_perms:
                 result['security_issue'] = 'Race condition allows insecure permissions'
                 
-            self.test_results.append(result)
+            self._add_result(result)
             
         except Exception as e:
-            self.test_results.append({
+            self._add_result({
                 'test': 'Permission race conditions',
                 'status': 'ERROR',
                 'error': str(e)
@@ -301,12 +465,24 @@ class PermissionSecurityTester:
         """Run all permission security tests"""
         print("🔐 Starting Permission Manipulation Security Tests...")
         
+        # These tests work in their own directories, so they can run side by side
+        concurrent_tests = [
+            self.test_socket_directory_permissions,
+            self.test_symlink_attacks,
+            self.test_file_ownership_security,
+            self.test_race_condition_permissions
+        ]
+        
         try:
-            self.test_socket_directory_permissions()
-            self.test_symlink_attacks()
-            self.test_file_ownership_security()
-            self.test_umask_security()
-            self.test_race_condition_permissions()
+            with ThreadPoolExecutor(max_workers=len(concurrent_tests)) as executor:
+                futures = [executor.submit(self._collect_results, test) for test in concurrent_tests]
+                # Merge in declared order, not completion order, so the report is stable
+                for future in futures:
+                    self.test_results.extend(future.result())
+                    
+            # The umask is process-wide, so this runs alone rather than change
+            # the mode of files the other tests are creating
+            self.test_results.extend(self._collect_results(self.test_umask_security))
             
         finally:
             self.cleanup()
@@ -314,10 +490,21 @@ class PermissionSecurityTester:
     def generate_report(self):
         """Generate detailed test report"""
         total_tests = len(self.test_results)
-        passed_tests = sum(1 for r in self.test_results if r['status'] == 'PASS')
-        failed_tests = sum(1 for r in self.test_results if r['status'] == 'FAIL')
-        error_tests = sum(1 for r in self.test_results if r['status'] == 'ERROR')
-        detected_tests = sum(1 for r in self.test_results if r['status'] == 'DETECTED')
+        
+        # Tally every status, and the failures that validate detection, in one pass
+        passed_tests = failed_tests = error_tests = detected_tests = expected_failures = 0
+        for r in self.test_results:
+            if r.get('test_validates_detection'):
+                expected_failures += 1
+            status = r['status']
+            if status == 'PASS':
+                passed_tests += 1
+            elif status == 'FAIL':
+                failed_tests += 1
+            elif status == 'ERROR':
+                error_tests += 1
+            elif status == 'DETECTED':
+                detected_tests += 1
         
         report = {
             'test_type': 'Permission Manipulation Security',
@@ -337,8 +524,7 @@ class PermissionSecurityTester:
         report_dir = Path("tests/security/reports")
         report_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(report_dir / "permission_security_report.json", "w") as f:
-            json.dump(report, f, indent=2)
+        write_json_report(report_dir / "permission_security_report.json", report)
             
         # Print summary
         print(f"\n📊 Permission Security Test Summary:")
@@ -352,9 +538,6 @@ class PermissionSecurityTester:
             print(f"   ❌ {failed_tests + error_tests} critical security issues found")
             
             # Check if failures are expected (testing security detection)
-            expected_failures = sum(1 for r in self.test_results 
-                                  if r.get('test_validates_detection', False))
-            
             if failed_tests <= expected_failures:
                 print(f"   ℹ️  All failures are expected (testing security detection)")
                 return True
@@ -7,31 +7,104 @@ This script tests rate limiting and timeout mechanisms to ensure:
 2. Connections are closed on abuse
 3. Timeout enforcement works correctly
 4. DoS protection is effective
+
+The timeout tests wait on the agent's own timers. Point them at a build with
+shorter ones by setting QPA_CONN_TIMEOUT_MS (connection timeout, default
+60000) and QPA_HB_INTERVAL_MS (heartbeat interval, default 30000).
 """
 
+import array
 import asyncio
 import json
+import os
+import resource
 import socket
 import threading
 import time
 import sys
-import random
+import selectors
+import statistics
+from collections import Counter, deque
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from _report import write_json_report
+
+# Agent timers under test (IPCServer::CONNECTION_TIMEOUT_MS / HEARTBEAT_INTERVAL_MS);
+# every wait in the timeout tests is derived from these
+CONNECTION_TIMEOUT_MS = int(os.environ.get("QPA_CONN_TIMEOUT_MS", "60000"))
+HEARTBEAT_INTERVAL_MS = int(os.environ.get("QPA_HB_INTERVAL_MS", "30000"))
+
+# Simultaneous connections opened against the agent in the connection-flood test,
+# capped by _connection_budget so the client's own fd limit is never what is measured
+CONCURRENT_CONNECTIONS_TO_TEST = 2048
+
+# File descriptors left free for the interpreter, the event loop and the report
+FD_HEADROOM = 64
+
+def _connection_budget():
+    """CONCURRENT_CONNECTIONS_TO_TEST, lowered to fit under the soft RLIMIT_NOFILE"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return CONCURRENT_CONNECTIONS_TO_TEST
+    return max(1, min(CONCURRENT_CONNECTIONS_TO_TEST, soft - FD_HEADROOM))
+
+# Monotonic integer-nanosecond clock for every duration and rate measurement;
+# wall-clock time is only used for timestamps that go into messages and reports
+_now = time.monotonic_ns
+
+# Slowloris payload: an authorization request trickled in up to the action id,
+# then the rest sent in one go
+SLOWLORIS_PARTIAL_MESSAGE = b'{"type": "check_authorization", "action_id": "'
+SLOWLORIS_MESSAGE_REST = b'org.example.test", "details": "test"}'
+
+# Per-message entries kept from each end of a run; everything else is aggregated
+RESULT_SAMPLES = 3
+
+def _latency_summary(latencies_ns):
+    """Reduce per-message latencies (ns) to min/p50/p99/max in seconds"""
+    if not latencies_ns:
+        return {}
+    p99 = (statistics.quantiles(latencies_ns, n=100, method='inclusive')[98]
+           if len(latencies_ns) > 1 else latencies_ns[0])
+    return {
+        'min': min(latencies_ns) / 1e9,
+        'p50': statistics.median(latencies_ns) / 1e9,
+        'p99': p99 / 1e9,
+        'max': max(latencies_ns) / 1e9
+    }
 
 class RateLimitingTester:
     def __init__(self, socket_path="/tmp/quickshell-polkit-agent"):
         self.socket_path = socket_path
         self.test_results = []
         self.failures = 0
+        # One persistent connection per thread:
+        # thread ident -> (socket, unread bytes, reusable recv buffer)
+        self._pool = {}
+        self._pool_lock = threading.Lock()
+        # Heartbeats carry no per-message state (timestamp is optional), so
+        # every test shares one pre-encoded copy
+        self._heartbeat_bytes = b'{"type":"heartbeat"}\n'
         
     def create_test_message(self):
         """Create a simple test message"""
-        return json.dumps({
-            "type": "heartbeat",
-            "timestamp": int(time.time() * 1000)
-        }) + "\n"
+        return self._heartbeat_bytes
         
+    def _pace(self, rate_hz, n):
+        """Yield 0..n-1, each on its own deadline at rate_hz
+        
+        Deadlines advance by a fixed interval from the start, so time spent
+        sending does not stretch the schedule the way a fixed sleep would.
+        """
+        interval_ns = int(1e9 / rate_hz)
+        deadline = _now()
+        for i in range(n):
+            now = _now()
+            if deadline > now:
+                time.sleep((deadline - now) / 1e9)
+            yield i
+            deadline += interval_ns
+            
     def test_message_rate_limiting(self):
         """Test message rate limiting enforcement"""
         print("🚦 Testing message rate limiting...")
@@ -39,35 +112,44 @@ class RateLimitingTester:
         # Configuration based on IPCServer constants
         MAX_MESSAGES_PER_SECOND = 10
         RATE_LIMIT_WINDOW_MS = 1000
+        NORMAL_MESSAGES = 5
+        NORMAL_RATE_PER_SECOND = 5  # Well under the 10/second limit
+        BURST_MESSAGES = 20  # 2x the rate limit
         
         try:
             # Test 1: Send messages within rate limit
             print("  Testing normal rate (within limits)...")
             
-            normal_rate_results = []
             test_msg = self.create_test_message()
+            # Preallocated structure-of-arrays: latency in ns, one ok byte per message
+            latencies = array.array('q', bytes(8 * NORMAL_MESSAGES))
+            ok = bytearray(NORMAL_MESSAGES)
+            first_samples = []
+            last_samples = deque(maxlen=RESULT_SAMPLES)
             
             # Send messages at normal rate (under limit)
-            for i in range(5):  # Well under the 10/second limit
-                start_time = time.time()
+            for i in self._pace(NORMAL_RATE_PER_SECOND, NORMAL_MESSAGES):
+                start_ns = _now()
                 success = self.send_single_message(test_msg)
-                end_time = time.time()
+                end_ns = _now()
                 
-                normal_rate_results.append({
+                latencies[i] = end_ns - start_ns
+                ok[i] = bool(success)
+                sample = {
                     'message_num': i + 1,
                     'success': success,
-                    'response_time': end_time - start_time
-                })
-                
-                time.sleep(0.2)  # 200ms between messages = 5/second
+                    'response_time': (end_ns - start_ns) / 1e9
+                }
+                (first_samples if i < RESULT_SAMPLES else last_samples).append(sample)
                 
             normal_rate_result = {
                 'test': 'Normal message rate (within limits)',
-                'rate_per_second': 5,
+                'rate_per_second': NORMAL_RATE_PER_SECOND,
                 'limit_per_second': MAX_MESSAGES_PER_SECOND,
-                'results': normal_rate_results,
-                'total_sent': len(normal_rate_results),
-                'successful': sum(1 for r in normal_rate_results if r['success']),
+                'total_sent': NORMAL_MESSAGES,
+                'successful': ok.count(1),
+                'response_time': _latency_summary(latencies),
+                'sample_results': first_samples + list(last_samples),
                 'status': 'PASS'
             }
             
@@ -76,36 +158,45 @@ class RateLimitingTester:
             # Test 2: Rapid burst exceeding rate limit
             print("  Testing burst rate (exceeding limits)...")
             
-            burst_results = []
-            burst_start = time.time()
+            latencies = array.array('q', bytes(8 * BURST_MESSAGES))
+            ok = bytearray(BURST_MESSAGES)
+            first_samples = []
+            last_samples = deque(maxlen=RESULT_SAMPLES)
+            burst_start_ns = _now()
             
             # Send burst of messages exceeding rate limit
-            for i in range(20):  # 2x the rate limit
-                start_time = time.time()
+            for i in range(BURST_MESSAGES):
+                start_ns = _now()
                 success = self.send_single_message(test_msg)
-                end_time = time.time()
+                end_ns = _now()
                 
-                burst_results.append({
+                latencies[i] = end_ns - start_ns
+                ok[i] = bool(success)
+                sample = {
                     'message_num': i + 1,
                     'success': success,
-                    'response_time': end_time - start_time,
-                    'time_from_burst_start': end_time - burst_start
-                })
+                    'response_time': (end_ns - start_ns) / 1e9,
+                    'time_from_burst_start': (end_ns - burst_start_ns) / 1e9
+                }
+                (first_samples if i < RESULT_SAMPLES else last_samples).append(sample)
                 
                 # No delay - send as fast as possible
                 
-            burst_duration = time.time() - burst_start
-            effective_rate = len(burst_results) / burst_duration
+            burst_duration = (_now() - burst_start_ns) / 1e9
+            messages_sent = BURST_MESSAGES
+            successful = ok.count(1)
+            effective_rate = messages_sent / burst_duration
             
             burst_result = {
                 'test': 'Burst message rate (exceeding limits)',
-                'messages_sent': len(burst_results),
+                'messages_sent': messages_sent,
                 'burst_duration_seconds': burst_duration,
                 'effective_rate_per_second': effective_rate,
                 'limit_per_second': MAX_MESSAGES_PER_SECOND,
-                'successful_messages': sum(1 for r in burst_results if r['success']),
-                'failed_messages': sum(1 for r in burst_results if not r['success']),
-                'results': burst_results,
+                'successful_messages': successful,
+                'failed_messages': messages_sent - successful,
+                'response_time': _latency_summary(latencies),
+                'sample_results': first_samples + list(last_samples),
                 'status': 'TESTED'
             }
             
@@ -129,42 +220,50 @@ class RateLimitingTester:
             })
             self.failures += 1
             
+        finally:
+            # The agent serves one client at a time; free the slot for the other tests
+            self.close_pooled_connections()
+            
     def test_connection_timeout_enforcement(self):
         """Test connection timeout enforcement"""
         print("⏱️ Testing connection timeout enforcement...")
         
-        HEARTBEAT_INTERVAL_MS = 30000  # 30 seconds
-        CONNECTION_TIMEOUT_MS = 60000  # 60 seconds
+        # Margins scale with the timers so shortened test builds finish quickly
+        timeout_wait_s = CONNECTION_TIMEOUT_MS * 13 / 12 / 1000  # 65s by default
+        heartbeat_test_ns = HEARTBEAT_INTERVAL_MS * 7 // 6 * 1_000_000  # 35s by default
+        heartbeat_period_s = HEARTBEAT_INTERVAL_MS / 3 / 1000  # 10s by default
         
         try:
             # Test 1: Connection without heartbeat (should timeout)
             print("  Testing connection without heartbeat...")
             
-            start_time = time.time()
+            start_ns = _now()
             timeout_test_result = {
                 'test': 'Connection timeout without heartbeat',
                 'expected_timeout_seconds': CONNECTION_TIMEOUT_MS / 1000,
-                'start_time': start_time
+                'start_time': time.time()
             }
             
             try:
                 # Attempt to create and hold connection without sending heartbeat
                 sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                sock.settimeout(65)  # Slightly longer than expected timeout
+                sock.settimeout(timeout_wait_s)  # Slightly longer than expected timeout
                 
                 sock.connect(self.socket_path)
+                # Buffered line reader: replies are newline-framed
+                rfile = sock.makefile('rb', buffering=4096)
                 
                 # Read welcome message if any
                 try:
-                    welcome = sock.recv(1024)
+                    welcome = rfile.readline()
                     timeout_test_result['welcome_received'] = len(welcome) > 0
                 except:
                     timeout_test_result['welcome_received'] = False
                     
                 # Wait for timeout without sending heartbeat
                 try:
-                    # This should timeout after 60 seconds
-                    data = sock.recv(1024)
+                    # This should timeout after CONNECTION_TIMEOUT_MS
+                    data = rfile.readline()
                     timeout_test_result['unexpected_data'] = True
                     timeout_test_result['data_received'] = len(data)
                 except socket.timeout:
@@ -172,6 +271,7 @@ class RateLimitingTester:
                 except ConnectionResetError:
                     timeout_test_result['connection_reset'] = True
                     
+                rfile.close()
                 sock.close()
                 
             except ConnectionRefusedError:
@@ -184,8 +284,7 @@ class RateLimitingTester:
                 timeout_test_result['error'] = str(e)
                 timeout_test_result['status'] = 'ERROR'
                 
-            end_time = time.time()
-            timeout_test_result['total_time_seconds'] = end_time - start_time
+            timeout_test_result['total_time_seconds'] = (_now() - start_ns) / 1e9
             
             if 'status' not in timeout_test_result:
                 if timeout_test_result.get('connection_timed_out') or timeout_test_result.get('connection_reset'):
@@ -204,34 +303,37 @@ class RateLimitingTester:
             heartbeat_test_result = {
                 'test': 'Connection with proper heartbeat',
                 'heartbeat_interval_seconds': HEARTBEAT_INTERVAL_MS / 1000,
-                'test_duration_seconds': 35  # Test for 35 seconds
+                'test_duration_seconds': heartbeat_test_ns / 1e9
             }
             
             try:
                 sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                sock.settimeout(40)  # Longer than test duration
+                sock.settimeout(heartbeat_test_ns / 1e9 + heartbeat_period_s / 2)  # Longer than test duration
                 
                 sock.connect(self.socket_path)
+                rfile = sock.makefile('rb', buffering=4096)
+                # The welcome line comes first; skip it so each read below is an ack
+                rfile.readline()
                 
                 # Send heartbeats at regular intervals
-                heartbeat_msg = json.dumps({"type": "heartbeat"}) + "\n"
                 heartbeats_sent = 0
-                test_start = time.time()
+                # acks[n] records whether heartbeat n + 1 was answered
+                acks = heartbeat_test_result['acks'] = []
+                test_start_ns = _now()
                 
-                while (time.time() - test_start) < 35:  # Test for 35 seconds
-                    sock.send(heartbeat_msg.encode('utf-8'))
+                while _now() - test_start_ns < heartbeat_test_ns:
+                    sock.send(self._heartbeat_bytes)
                     heartbeats_sent += 1
                     
                     # Try to receive heartbeat ack
                     try:
-                        response = sock.recv(1024)
-                        if response:
-                            heartbeat_test_result[f'heartbeat_{heartbeats_sent}_ack'] = True
+                        acks.append(bool(rfile.readline()))
                     except:
-                        pass
+                        acks.append(False)
                         
-                    time.sleep(10)  # Send heartbeat every 10 seconds
+                    time.sleep(heartbeat_period_s)
                     
+                rfile.close()
                 sock.close()
                 
                 heartbeat_test_result['heartbeats_sent'] = heartbeats_sent
@@ -258,45 +360,50 @@ class RateLimitingTester:
             })
             self.failures += 1
             
-    def test_concurrent_connection_limits(self):
-        """Test concurrent connection limits and DoS protection"""
+    def test_concurrent_connection_limits(self, hold_seconds=0):
+        """Test concurrent connection limits and DoS protection
+        
+        hold_seconds keeps each accepted connection open after its reply; by
+        default sockets are closed as soon as the exchange is done.
+        """
         print("🔗 Testing concurrent connection limits...")
         
         try:
-            max_connections_to_test = 20
-            connection_results = []
+            # All connections share one event loop, so the count is bounded by fds, not threads
+            max_connections_to_test = _connection_budget()
             
-            def create_connection(conn_id):
+            async def create_connection(conn_id):
                 try:
-                    start_time = time.time()
-                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                    sock.settimeout(10)
-                    
-                    sock.connect(self.socket_path)
-                    
-                    # Try to send a message
-                    test_msg = self.create_test_message()
-                    sock.send(test_msg.encode('utf-8'))
+                    start_ns = _now()
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_unix_connection(self.socket_path), timeout=10
+                    )
                     
-                    # Try to receive response
                     try:
-                        response = sock.recv(1024)
-                        response_received = len(response) > 0
-                    except:
-                        response_received = False
+                        # Try to send a message
+                        writer.write(self.create_test_message())
+                        await writer.drain()
+                        
+                        # Try to receive response
+                        try:
+                            response = await asyncio.wait_for(reader.read(1024), timeout=10)
+                            response_received = len(response) > 0
+                        except Exception:
+                            response_received = False
+                            
+                        end_ns = _now()
+                        
+                        if hold_seconds:
+                            await asyncio.sleep(hold_seconds)
+                        
+                    finally:
+                        writer.close()
                         
-                    end_time = time.time()
-                    
-                    # Keep connection open for a bit
-                    time.sleep(2)
-                    
-                    sock.close()
-                    
                     return {
                         'connection_id': conn_id,
                         'success': True,
                         'response_received': response_received,
-                        'connection_time': end_time - start_time,
+                        'connection_time_ns': end_ns - start_ns,
                         'status': 'CONNECTED'
                     }
                     
@@ -318,17 +425,15 @@ class RateLimitingTester:
                     return {
                         'connection_id': conn_id,
                         'success': False,
-                        'error': str(e),
+                        'error': str(e) or type(e).__name__,
                         'status': 'ERROR'
                     }
                     
-            # Create multiple concurrent connections
-            with ThreadPoolExecutor(max_workers=max_connections_to_test) as executor:
-                futures = [executor.submit(create_connection, i) for i in range(max_connections_to_test)]
+            async def create_connections():
+                return await asyncio.gather(*[create_connection(i) for i in range(max_connections_to_test)])
                 
-                for future in as_completed(futures):
-                    result = future.result()
-                    connection_results.append(result)
+            # Create multiple concurrent connections
+            connection_results = asyncio.run(create_connections())
                     
             # Analyze results
             successful_connections = [r for r in connection_results if r['success']]
@@ -341,7 +446,9 @@ class RateLimitingTester:
                 'successful_connections': len(successful_connections),
                 'refused_connections': len(refused_connections),
                 'error_connections': len(error_connections),
-                'connection_details': connection_results,
+                'connection_time': _latency_summary([r['connection_time_ns'] for r in successful_connections]),
+                'error_counts': dict(Counter(r['error'] for r in error_connections)),
+                'sample_results': connection_results[:RESULT_SAMPLES] + connection_results[RESULT_SAMPLES:][-RESULT_SAMPLES:],
                 'status': 'TESTED'
             }
             
@@ -383,32 +490,36 @@ class RateLimitingTester:
                 sock.connect(self.socket_path)
                 
                 # Send incomplete JSON very slowly
-                incomplete_message = '{"type": "check_authorization", "action_id": "'
+                incomplete_message = memoryview(SLOWLORIS_PARTIAL_MESSAGE)
                 
+                # Switch to non-blocking once and poll readiness, rather than
+                # flipping the socket timeout around every probe
+                sock.setblocking(False)
                 bytes_sent = 0
-                for char in incomplete_message:
-                    sock.send(char.encode('utf-8'))
-                    bytes_sent += 1
-                    time.sleep(0.5)  # Send one character every 500ms
-                    
-                    # Check if connection is still alive
-                    try:
-                        sock.settimeout(0.1)
-                        data = sock.recv(1024, socket.MSG_DONTWAIT)
-                        if data:
-                            slowloris_result['server_response'] = 'Received data during slow send'
-                            break
-                    except socket.error:
-                        pass  # No data available, continue
-                    finally:
-                        sock.settimeout(120)
-                        
-                    if bytes_sent >= 20:  # Limit test duration
-                        break
+                with selectors.DefaultSelector() as sel:
+                    sel.register(sock, selectors.EVENT_READ)
+                    while bytes_sent < len(incomplete_message):
+                        # 4 bytes every 2s: the same 2 bytes/second trickle as one
+                        # character per 500ms, in a quarter of the sends
+                        try:
+                            bytes_sent += sock.send(incomplete_message[bytes_sent:bytes_sent + 4])
+                        except BlockingIOError:
+                            pass  # Send buffer full, resend from the same offset next tick
+                        time.sleep(2.0)
                         
+                        # Check if connection is still alive
+                        if sel.select(0):
+                            data = sock.recv(1024)
+                            if data:
+                                slowloris_result['server_response'] = 'Received data during slow send'
+                                break
+                            
+                        if bytes_sent >= 20:  # Limit test duration
+                            break
+                
                 # Try to complete the message
-                remaining_message = 'org.example.test", "details": "test"}'
-                sock.send(remaining_message.encode('utf-8'))
+                sock.settimeout(120)
+                sock.send(SLOWLORIS_MESSAGE_REST)
                 
                 # Check final response
                 try:
@@ -447,20 +558,74 @@ class RateLimitingTester:
             })
             self.failures += 1
             
-    def send_single_message(self, message):
-        """Send a single message and return success status"""
-        try:
+    def _read_line(self, conn):
+        """Read one newline-terminated reply from a pooled connection"""
+        sock, buffer, scratch = conn
+        while True:
+            end = buffer.find(b"\n")
+            if end >= 0:
+                line = bytes(buffer[:end])
+                del buffer[:end + 1]
+                return line
+            # Receive into the connection's fixed buffer rather than a fresh bytes per read
+            n = sock.recv_into(scratch)
+            if not n:
+                raise ConnectionResetError("Agent closed the connection")
+            buffer += scratch[:n]
+            
+    def _pooled_connection(self):
+        """Return this thread's persistent agent connection, connecting on first use"""
+        ident = threading.get_ident()
+        conn = self._pool.get(ident)
+        if conn is None:
             sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
             sock.settimeout(5.0)
+            try:
+                sock.connect(self.socket_path)
+                conn = (sock, bytearray(), memoryview(bytearray(4096)))
+                # The agent greets every new client; that is not a reply to a message
+                self._read_line(conn)
+            except BaseException:
+                sock.close()
+                raise
+            with self._pool_lock:
+                self._pool[ident] = conn
+        return conn
+        
+    def _drop_pooled_connection(self):
+        """Forget and close this thread's connection, e.g. after the agent dropped it"""
+        with self._pool_lock:
+            conn = self._pool.pop(threading.get_ident(), None)
+        if conn is not None:
+            conn[0].close()
+            
+    def close_pooled_connections(self):
+        """Close every pooled connection"""
+        with self._pool_lock:
+            conns = list(self._pool.values())
+            self._pool.clear()
+        for sock, *_ in conns:
+            sock.close()
+            
+    def send_single_message(self, message):
+        """Send a single message on this thread's persistent connection and return success status
+        
+        message may be a str or already encoded bytes.  Success means the agent
+        answered with something other than an error, so messages it rejects
+        (e.g. over the rate limit) count as failures.
+        """
+        if isinstance(message, str):
+            message = message.encode('utf-8')
             
-            sock.connect(self.socket_path)
-            sock.send(message.encode('utf-8'))
+        try:
+            conn = self._pooled_connection()
+            # One message per write: the agent parses each read as a single JSON document
+            conn[0].sendall(message)
             
-            # Try to receive response
-            response = sock.recv(1024)
-            sock.close()
+            # Each message gets exactly one reply line
+            response = self._read_line(conn)
             
-            return len(response) > 0
+            return json.loads(response).get('type') != 'error'
             
         except ConnectionRefusedError:
             # Agent not running - count as skipped, not failure
@@ -469,12 +634,26 @@ class RateLimitingTester:
             # Socket file doesn't exist - agent not running
             return None
         except Exception:
+            self._drop_pooled_connection()
             return False
             
     def run_rate_limiting_tests(self):
         """Run all rate limiting and timeout tests"""
         print("🛡️ Starting Rate Limiting and Timeout Enforcement Tests...")
         
+        # Without the socket every phase would only fail to connect (the flood
+        # test thousands of times over), so record the skips from one stat()
+        if not os.path.exists(self.socket_path):
+            print(f"  Socket {self.socket_path} not found - agent not running")
+            for test in ('Message rate limiting', 'Connection timeout enforcement',
+                         'Concurrent connection limits', 'Slowloris attack protection'):
+                self.test_results.append({
+                    'test': test,
+                    'socket_not_found': True,
+                    'status': 'SKIPPED'
+                })
+            return
+            
         self.test_message_rate_limiting()
         self.test_connection_timeout_enforcement()
         self.test_concurrent_connection_limits()
@@ -483,10 +662,11 @@ class RateLimitingTester:
     def generate_report(self):
         """Generate detailed test report"""
         total_tests = len(self.test_results)
-        passed_tests = sum(1 for r in self.test_results if r['status'] == 'PASS')
-        failed_tests = sum(1 for r in self.test_results if r['status'] == 'FAIL')
-        error_tests = sum(1 for r in self.test_results if r['status'] == 'ERROR')
-        skipped_tests = sum(1 for r in self.test_results if r['status'] == 'SKIPPED')
+        counts = Counter(r['status'] for r in self.test_results)
+        passed_tests = counts['PASS']
+        failed_tests = counts['FAIL']
+        error_tests = counts['ERROR']
+        skipped_tests = counts['SKIPPED']
         
         report = {
             'test_type': 'Rate Limiting and Timeout Enforcement',
@@ -506,8 +686,7 @@ class RateLimitingTester:
         report_dir = Path("tests/security/reports")
         report_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(report_dir / "rate_limiting_report.json", "w") as f:
-            json.dump(report, f, indent=2)
+        write_json_report(report_dir / "rate_limiting_report.json", report)
             
         # Print summary
         print(f"\n📊 Rate Limiting Test Summary:")
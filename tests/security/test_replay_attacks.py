@@ -9,17 +9,63 @@ This script tests authentication cookie replay attacks and session expiry mechan
 4. Timestamp validation
 """
 
-import asyncio
 import json
-import socket
 import threading
 import time
 import hashlib
 import hmac
 import random
 import sys
-from pathlib import Path
-from datetime import datetime, timedelta
+from collections import Counter
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+from _report import write_json_report
+
+# Payload fields (besides type and timestamp) of the authenticated messages
+# these tests build
+MESSAGE_FIELDS = {
+    "submit_authentication": ("action_id", "cookie", "response"),
+    "check_authorization": ("action_id", "details"),
+}
+
+# HMAC key-pad translation tables (RFC 2104)
+_HMAC_IPAD = bytes(b ^ 0x36 for b in range(256))
+_HMAC_OPAD = bytes(b ^ 0x5c for b in range(256))
+
+def _now_ms():
+    """Current wall-clock time in integer milliseconds, without a float round-trip"""
+    return time.time_ns() // 1_000_000
+
+_encode_json_value = json.JSONEncoder(sort_keys=True).encode
+
+def _canonical_template(message_type, fields):
+    """%-template reproducing json.dumps(message, sort_keys=True) for one message type"""
+    placeholders = {name: f"%({name})s" for name in fields}
+    placeholders["timestamp"] = "%(timestamp)d"
+    placeholders["type"] = json.dumps(message_type).replace("%", "%%")
+    return "{" + ", ".join(f'"{name}": {placeholders[name]}' for name in sorted(placeholders)) + "}"
+
+# message type -> (payload field names, canonical template); the key order is
+# fixed per type, so no per-message sort is needed
+_CANONICAL_TEMPLATES = {
+    message_type: (frozenset(fields), _canonical_template(message_type, fields))
+    for message_type, fields in MESSAGE_FIELDS.items()
+}
+
+class ReplayResult(NamedTuple):
+    """Outcome of one replay test case; converted to a dict only when the report is written"""
+    test: str
+    status: str
+    details: dict
+    
+    @classmethod
+    def from_dict(cls, result):
+        """Split a result dict built by a test into a record (takes ownership of the dict)"""
+        return cls(result.pop('test'), result.pop('status'), result)
+        
+    def to_dict(self):
+        return {'test': self.test, 'status': self.status, **self.details}
 
 class ReplayAttackTester:
     def __init__(self, socket_path="/tmp/quickshell-polkit-agent"):
@@ -27,14 +73,52 @@ class ReplayAttackTester:
         self.test_results = []
         self.failures = 0
         self.hmac_key = b"test_key_for_security_testing"
+        # The key never changes, so hash its inner and outer pad blocks once;
+        # each HMAC then only copies these states and hashes the message
+        block_size = hashlib.sha256().block_size
+        key = self.hmac_key
+        if len(key) > block_size:
+            key = hashlib.sha256(key).digest()
+        key = key.ljust(block_size, b"\0")
+        self._inner_base = hashlib.sha256(key.translate(_HMAC_IPAD))
+        self._outer_base = hashlib.sha256(key.translate(_HMAC_OPAD))
         
     def generate_hmac(self, data):
-        """Generate HMAC for message authentication"""
-        return hmac.new(self.hmac_key, data.encode('utf-8'), hashlib.sha256).hexdigest()
+        """Generate HMAC for message authentication (data may be str or bytes)"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self.generate_hmac_with_prefix(self._inner_base, data)
+        
+    def hmac_prefix_state(self, prefix):
+        """Inner HMAC state with prefix already hashed, for signing messages that share it"""
+        inner = self._inner_base.copy()
+        inner.update(prefix)
+        return inner
+        
+    def generate_hmac_with_prefix(self, prefix_state, suffix):
+        """HMAC of prefix + suffix, continuing from hmac_prefix_state(prefix)"""
+        inner = prefix_state.copy()
+        inner.update(suffix)
+        outer = self._outer_base.copy()
+        outer.update(inner.digest())
+        return outer.hexdigest()
+        
+    def canonical_bytes(self, message_type, timestamp, fields):
+        """HMAC input for a message: its json.dumps(sort_keys=True) encoding, without hmac
+        
+        Filled straight into the type's template when it has one.
+        """
+        canonical = _CANONICAL_TEMPLATES.get(message_type)
+        if canonical is not None and fields.keys() == canonical[0]:
+            values = {name: _encode_json_value(value) for name, value in fields.items()}
+            values["timestamp"] = timestamp
+            return (canonical[1] % values).encode('utf-8')
+        message = {"type": message_type, "timestamp": timestamp, **fields}
+        return json.dumps(message, sort_keys=True).encode('utf-8')
         
     def create_authenticated_message(self, message_type, **kwargs):
         """Create an authenticated message with HMAC and timestamp"""
-        timestamp = int(time.time() * 1000)  # Current timestamp in milliseconds
+        timestamp = _now_ms()  # Current timestamp in milliseconds
         
         message = {
             "type": message_type,
@@ -43,8 +127,7 @@ class ReplayAttackTester:
         }
         
         # Generate HMAC (excluding the hmac field itself)
-        message_for_hmac = json.dumps(message, sort_keys=True)
-        message["hmac"] = self.generate_hmac(message_for_hmac)
+        message["hmac"] = self.generate_hmac(self.canonical_bytes(message_type, timestamp, kwargs))
         
         return message
         
@@ -62,15 +145,26 @@ class ReplayAttackTester:
         for i, cookie in enumerate(test_cookies):
             try:
                 # Create original authentication message
-                original_msg = self.create_authenticated_message(
-                    "submit_authentication",
-                    cookie=cookie,
-                    response="test_password",
-                    action_id="org.example.test"
+                payload = {
+                    'cookie': cookie,
+                    'response': "test_password",
+                    'action_id': "org.example.test"
+                }
+                original_msg = self.create_authenticated_message("submit_authentication", **payload)
+                
+                # Variants of this cookie's message differ only from the timestamp
+                # digits on, so the bytes before them are hashed once and every
+                # variant's HMAC continues from that state
+                template = self.canonical_bytes(
+                    "submit_authentication", original_msg['timestamp'], payload
                 )
+                ts_start = template.index(b'"timestamp": ') + len(b'"timestamp": ')
+                after_timestamp = template[template.index(b',', ts_start):]
+                prefix_state = self.hmac_prefix_state(template[:ts_start])
                 
                 # Test 1: Immediate replay (should potentially succeed if no nonce)
-                replay_msg = original_msg.copy()
+                # An exact replay is the very same message, so it is shared as is
+                replay_msg = original_msg
                 
                 result_immediate = {
                     'test': f'Immediate cookie replay #{i+1}',
@@ -81,65 +175,59 @@ class ReplayAttackTester:
                     'status': 'TESTED'
                 }
                 
-                self.test_results.append(result_immediate)
+                self.test_results.append(ReplayResult.from_dict(result_immediate))
                 
                 # Test 2: Delayed replay (should fail due to timestamp)
                 time.sleep(0.1)  # Small delay
-                delayed_msg = original_msg.copy()
-                delayed_msg['timestamp'] = int(time.time() * 1000)  # New timestamp but same cookie
+                delayed_timestamp = _now_ms()  # New timestamp but same cookie
                 
                 # Don't regenerate HMAC - this should fail HMAC verification
+                delayed_hmac = original_msg['hmac']
                 result_delayed = {
                     'test': f'Delayed cookie replay #{i+1}',
                     'cookie': cookie,
                     'original_timestamp': original_msg['timestamp'],
-                    'replay_timestamp': delayed_msg['timestamp'],
-                    'time_diff_ms': delayed_msg['timestamp'] - original_msg['timestamp'],
-                    'hmac_matches': delayed_msg['hmac'] == original_msg['hmac'],
+                    'replay_timestamp': delayed_timestamp,
+                    'time_diff_ms': delayed_timestamp - original_msg['timestamp'],
+                    'hmac_matches': hmac.compare_digest(delayed_hmac, original_msg['hmac']),
                     'status': 'SHOULD_FAIL_HMAC',
                     'expected_result': 'HMAC verification should fail'
                 }
                 
-                self.test_results.append(result_delayed)
+                self.test_results.append(ReplayResult.from_dict(result_delayed))
                 
                 # Test 3: Cookie with old timestamp
-                old_timestamp = int((time.time() - 60) * 1000)  # 60 seconds ago
-                old_msg = self.create_authenticated_message(
-                    "submit_authentication",
-                    cookie=cookie,
-                    response="test_password",
-                    action_id="org.example.test"
-                )
-                old_msg['timestamp'] = old_timestamp
+                old_timestamp = _now_ms() - 60_000  # 60 seconds ago
                 
                 # Regenerate HMAC with old timestamp
-                old_msg_for_hmac = {k: v for k, v in old_msg.items() if k != 'hmac'}
-                old_msg_data = json.dumps(old_msg_for_hmac, sort_keys=True)
-                old_msg['hmac'] = self.generate_hmac(old_msg_data)
+                old_hmac = self.generate_hmac_with_prefix(
+                    prefix_state, b'%d' % old_timestamp + after_timestamp
+                )
                 
                 result_old = {
                     'test': f'Old timestamp cookie replay #{i+1}',
                     'cookie': cookie,
-                    'timestamp': old_msg['timestamp'],
+                    'timestamp': old_timestamp,
                     'age_seconds': 60,
                     'status': 'SHOULD_FAIL_TIMESTAMP',
                     'expected_result': 'Should fail due to old timestamp'
                 }
                 
-                self.test_results.append(result_old)
+                self.test_results.append(ReplayResult.from_dict(result_old))
                 
             except Exception as e:
-                self.test_results.append({
+                self.test_results.append(ReplayResult.from_dict({
                     'test': f'Cookie replay test #{i+1}',
                     'status': 'ERROR',
                     'error': str(e)
-                })
+                }))
                 self.failures += 1
                 
     def test_session_expiry_enforcement(self):
         """Test session timeout and expiry enforcement"""
         print("⏰ Testing session expiry enforcement...")
         
+        results = []
         try:
             # Test different session timeout scenarios
             session_tests = [
@@ -149,9 +237,14 @@ class ReplayAttackTester:
                 {'name': 'Edge case session', 'age_minutes': 5.0, 'should_expire': False},  # Exactly at timeout
             ]
             
-            for test_case in session_tests:
-                session_start_time = int((time.time() - test_case['age_minutes'] * 60) * 1000)
-                current_time = int(time.time() * 1000)
+            # One slot per case, handed to test_results in one go
+            results = [None] * len(session_tests)
+            
+            for n, test_case in enumerate(session_tests):
+                # One clock reading per case: the age is exactly the one under
+                # test, with no clock step or tick between two reads
+                current_time = _now_ms()
+                session_start_time = current_time - int(test_case['age_minutes'] * 60_000)
                 
                 # Simulate session age check
                 session_age_ms = current_time - session_start_time
@@ -174,14 +267,18 @@ class ReplayAttackTester:
                     result['security_issue'] = 'Session expiry logic incorrect'
                     self.failures += 1
                     
-                self.test_results.append(result)
+                results[n] = result
                 
+            self.test_results.extend(map(ReplayResult.from_dict, results))
+            
         except Exception as e:
-            self.test_results.append({
+            # Keep the cases that finished before the failure
+            self.test_results.extend(ReplayResult.from_dict(r) for r in results if r is not None)
+            self.test_results.append(ReplayResult.from_dict({
                 'test': 'Session expiry enforcement',
                 'status': 'ERROR',
                 'error': str(e)
-            })
+            }))
             self.failures += 1
             
     def test_concurrent_authentication_race(self):
@@ -192,9 +289,15 @@ class ReplayAttackTester:
             # Simulate concurrent authentication attempts with same cookie
             cookie = "race_condition_test_cookie"
             num_threads = 5
-            results = []
+            # Every worker builds its message, then all of them start the
+            # authentication together
+            barrier = threading.Barrier(num_threads)
+            # Random timings are drawn up front, so workers never contend on
+            # the shared generator once they are racing
+            start_delays = [random.uniform(0.001, 0.01) for _ in range(num_threads)]
+            processing_times = [random.uniform(0.01, 0.05) for _ in range(num_threads)]
             
-            def authenticate_worker(worker_id):
+            def authenticate_worker(worker_id, start_delay, processing_time):
                 try:
                     # Create authentication message
                     auth_msg = self.create_authenticated_message(
@@ -204,14 +307,15 @@ class ReplayAttackTester:
                         action_id="org.example.race.test"
                     )
                     
+                    barrier.wait()
+                    
                     # Add small random delay to increase race condition likelihood
-                    time.sleep(random.uniform(0.001, 0.01))
+                    time.sleep(start_delay)
                     
                     # Simulate authentication processing
-                    processing_time = random.uniform(0.01, 0.05)
                     time.sleep(processing_time)
                     
-                    result = {
+                    return {
                         'worker_id': worker_id,
                         'cookie': cookie,
                         'timestamp': auth_msg['timestamp'],
@@ -219,29 +323,26 @@ class ReplayAttackTester:
                         'status': 'COMPLETED'
                     }
                     
-                    results.append(result)
-                    
                 except Exception as e:
-                    results.append({
+                    # Don't leave the other workers waiting on a party that never arrives
+                    barrier.abort()
+                    return {
                         'worker_id': worker_id,
                         'status': 'ERROR',
-                        'error': str(e)
-                    })
+                        'error': str(e) or type(e).__name__
+                    }
                     
-            # Start concurrent authentication threads
-            threads = []
-            start_time = time.time()
-            
-            for i in range(num_threads):
-                thread = threading.Thread(target=authenticate_worker, args=(i,))
-                threads.append(thread)
-                thread.start()
-                
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
+            # Start concurrent authentication workers
+            start_ns = time.monotonic_ns()
+            
+            with ThreadPoolExecutor(max_workers=num_threads) as executor:
+                futures = [
+                    executor.submit(authenticate_worker, i, start_delays[i], processing_times[i])
+                    for i in range(num_threads)
+                ]
+                results = [future.result() for future in futures]
                 
-            end_time = time.time()
+            end_ns = time.monotonic_ns()
             
             # Analyze race condition results
             completed_auths = [r for r in results if r['status'] == 'COMPLETED']
@@ -250,7 +351,7 @@ class ReplayAttackTester:
             race_result = {
                 'test': 'Concurrent authentication race condition',
                 'num_threads': num_threads,
-                'total_time_seconds': end_time - start_time,
+                'total_time_seconds': (end_ns - start_ns) / 1e9,
                 'completed_authentications': len(completed_auths),
                 'error_authentications': len(error_auths),
                 'same_cookie_used': cookie,
@@ -263,22 +364,23 @@ class ReplayAttackTester:
                 race_result['potential_issue'] = 'Multiple authentications completed for same cookie'
                 race_result['security_concern'] = 'Race condition may allow multiple successful authentications'
                 
-            self.test_results.append(race_result)
+            self.test_results.append(ReplayResult.from_dict(race_result))
             
         except Exception as e:
-            self.test_results.append({
+            self.test_results.append(ReplayResult.from_dict({
                 'test': 'Concurrent authentication race condition',
                 'status': 'ERROR',
                 'error': str(e)
-            })
+            }))
             self.failures += 1
             
     def test_timestamp_manipulation(self):
         """Test timestamp manipulation attacks"""
         print("🕐 Testing timestamp manipulation attacks...")
         
+        results = []
         try:
-            current_time = int(time.time() * 1000)
+            current_time = _now_ms()
             
             # Test various timestamp manipulation scenarios
             timestamp_tests = [
@@ -292,13 +394,24 @@ class ReplayAttackTester:
                 {'name': 'Maximum timestamp', 'timestamp': 2**63-1, 'should_fail': True},
             ]
             
-            for test_case in timestamp_tests:
+            max_skew_ms = 30000  # 30 seconds (typical max allowed skew)
+            
+            # Work out every case's timestamp, skew and verdict in one pass up
+            # front; the loop below only builds messages and results
+            test_timestamps = [
+                test_case['timestamp'] if 'timestamp' in test_case
+                else current_time + test_case['offset_ms']
+                for test_case in timestamp_tests
+            ]
+            time_diffs_ms = [test_timestamp - current_time for test_timestamp in test_timestamps]
+            rejections = [abs(time_diff_ms) > max_skew_ms for time_diff_ms in time_diffs_ms]
+            
+            # One slot per case, handed to test_results in one go
+            results = [None] * len(timestamp_tests)
+            
+            for n, (test_case, test_timestamp, time_diff_ms, should_reject) in enumerate(zip(
+                    timestamp_tests, test_timestamps, time_diffs_ms, rejections)):
                 try:
-                    if 'timestamp' in test_case:
-                        test_timestamp = test_case['timestamp']
-                    else:
-                        test_timestamp = current_time + test_case['offset_ms']
-                        
                     # Create message with manipulated timestamp
                     message = {
                         "type": "check_authorization",
@@ -310,13 +423,6 @@ class ReplayAttackTester:
                     message_data = json.dumps(message, sort_keys=True)
                     message["hmac"] = self.generate_hmac(message_data)
                     
-                    # Calculate time difference
-                    time_diff_ms = test_timestamp - current_time
-                    max_skew_ms = 30000  # 30 seconds (typical max allowed skew)
-                    
-                    # Determine if timestamp should be rejected
-                    should_reject = abs(time_diff_ms) > max_skew_ms
-                    
                     result = {
                         'test': f'Timestamp manipulation - {test_case["name"]}',
                         'test_timestamp': test_timestamp,
@@ -332,22 +438,26 @@ class ReplayAttackTester:
                         result['security_issue'] = 'Timestamp validation logic incorrect'
                         self.failures += 1
                         
-                    self.test_results.append(result)
+                    results[n] = result
                     
                 except Exception as e:
-                    self.test_results.append({
+                    results[n] = {
                         'test': f'Timestamp manipulation - {test_case["name"]}',
                         'status': 'ERROR',
                         'error': str(e)
-                    })
+                    }
                     self.failures += 1
                     
+            self.test_results.extend(map(ReplayResult.from_dict, results))
+            
         except Exception as e:
-            self.test_results.append({
+            # Keep the cases that finished before the failure
+            self.test_results.extend(ReplayResult.from_dict(r) for r in results if r is not None)
+            self.test_results.append(ReplayResult.from_dict({
                 'test': 'Timestamp manipulation',
                 'status': 'ERROR',
                 'error': str(e)
-            })
+            }))
             self.failures += 1
             
     def test_hmac_replay_protection(self):
@@ -369,13 +479,13 @@ class ReplayAttackTester:
                 'test': 'Exact HMAC replay',
                 'original_hmac': original_msg['hmac'],
                 'replay_hmac': replay_exact['hmac'],
-                'hmac_matches': original_msg['hmac'] == replay_exact['hmac'],
+                'hmac_matches': hmac.compare_digest(original_msg['hmac'], replay_exact['hmac']),
                 'timestamp_matches': original_msg['timestamp'] == replay_exact['timestamp'],
                 'status': 'POTENTIAL_REPLAY',
                 'security_note': 'Exact replay should be blocked by nonce or other mechanism'
             }
             
-            self.test_results.append(result_exact)
+            self.test_results.append(ReplayResult.from_dict(result_exact))
             
             # Test 2: Modified message with original HMAC (should fail)
             modified_msg = original_msg.copy()
@@ -385,48 +495,52 @@ class ReplayAttackTester:
             # Verify HMAC should fail for modified message
             modified_msg_for_hmac = {k: v for k, v in modified_msg.items() if k != 'hmac'}
             expected_hmac = self.generate_hmac(json.dumps(modified_msg_for_hmac, sort_keys=True))
+            # Constant-time, as a real verifier must compare signatures
+            modified_hmac_valid = hmac.compare_digest(modified_msg['hmac'], expected_hmac)
             
             result_modified = {
                 'test': 'Modified message with original HMAC',
                 'original_hmac': original_msg['hmac'],
                 'message_hmac': modified_msg['hmac'],
                 'expected_hmac': expected_hmac,
-                'hmac_verification_should_fail': modified_msg['hmac'] != expected_hmac,
+                'hmac_verification_should_fail': not modified_hmac_valid,
                 'status': 'SHOULD_FAIL_HMAC',
                 'security_check': 'HMAC verification must fail for modified messages'
             }
             
-            if modified_msg['hmac'] == expected_hmac:
+            if modified_hmac_valid:
                 result_modified['security_issue'] = 'HMAC verification failed to detect message modification'
                 self.failures += 1
                 
-            self.test_results.append(result_modified)
+            self.test_results.append(ReplayResult.from_dict(result_modified))
             
             # Test 3: Recomputed HMAC with different key (should fail)
             wrong_key = b"wrong_hmac_key_for_testing"
             wrong_hmac = hmac.new(wrong_key, json.dumps(modified_msg_for_hmac, sort_keys=True).encode('utf-8'), hashlib.sha256).hexdigest()
             
+            wrong_key_hmac_valid = hmac.compare_digest(expected_hmac, wrong_hmac)
+            
             result_wrong_key = {
                 'test': 'Message with wrong HMAC key',
                 'correct_hmac': expected_hmac,
                 'wrong_key_hmac': wrong_hmac,
-                'hmacs_different': expected_hmac != wrong_hmac,
+                'hmacs_different': not wrong_key_hmac_valid,
                 'status': 'SHOULD_FAIL_HMAC',
                 'security_check': 'HMAC with wrong key must fail verification'
             }
             
-            if expected_hmac == wrong_hmac:
+            if wrong_key_hmac_valid:
                 result_wrong_key['security_issue'] = 'HMAC collision detected - extremely unlikely!'
                 self.failures += 1
                 
-            self.test_results.append(result_wrong_key)
+            self.test_results.append(ReplayResult.from_dict(result_wrong_key))
             
         except Exception as e:
-            self.test_results.append({
+            self.test_results.append(ReplayResult.from_dict({
                 'test': 'HMAC replay protection',
                 'status': 'ERROR',
                 'error': str(e)
-            })
+            }))
             self.failures += 1
             
     def run_replay_tests(self):
@@ -441,10 +555,13 @@ class ReplayAttackTester:
         
     def generate_report(self):
         """Generate detailed test report"""
+        from pathlib import Path  # Only needed to write the report
+        
         total_tests = len(self.test_results)
-        passed_tests = sum(1 for r in self.test_results if r['status'] == 'PASS')
-        failed_tests = sum(1 for r in self.test_results if r['status'] == 'FAIL')
-        error_tests = sum(1 for r in self.test_results if r['status'] == 'ERROR')
+        counts = Counter(r.status for r in self.test_results)
+        passed_tests = counts['PASS']
+        failed_tests = counts['FAIL']
+        error_tests = counts['ERROR']
         
         report = {
             'test_type': 'Replay Attack and Race Condition Security',
@@ -456,15 +573,14 @@ class ReplayAttackTester:
                 'errors': error_tests,
                 'success_rate': f"{(passed_tests / max(1, total_tests)) * 100:.1f}%"
             },
-            'results': self.test_results
+            'results': [r.to_dict() for r in self.test_results]
         }
         
         # Save report
         report_dir = Path("tests/security/reports")
         report_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(report_dir / "replay_attack_report.json", "w") as f:
-            json.dump(report, f, indent=2)
+        write_json_report(report_dir / "replay_attack_report.json", report)
             
         # Print summary
         print(f"\n📊 Replay Attack Test Summary:")
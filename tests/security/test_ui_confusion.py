@@ -7,166 +7,581 @@ This script tests protection against UI confusion attacks to ensure:
 2. Fake agent responses are detected  
 3. Dialog content is properly validated
 4. UI spoofing attempts are blocked
+
+Set QPA_FAIL_FAST=1 to stop after the first test category that finds a
+vulnerability; the report then covers only the categories that ran.
 """
 
-import json
+import functools
+import re
 import sys
 import time
-import threading
-import socket
-import tempfile
+import unicodedata
+from collections import Counter
 import os
 from pathlib import Path
 
+from _report import write_json_report
+
+# C0 control characters other than tab, newline and carriage return
+_CTRL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# The same characters as bytes, for deleting them from ASCII text with
+# bytes.translate
+_CTRL_BYTES = bytes(i for i in range(32) if i not in (9, 10, 13))
+
+def _has_control_chars(text):
+    """Whether text contains a _CTRL_RE control character"""
+    if text.isascii():
+        # One C-level translate pass; several times faster than the regex
+        # on long ASCII payloads
+        data = text.encode('ascii')
+        return len(data.translate(None, _CTRL_BYTES)) != len(data)
+    return _CTRL_RE.search(text) is not None
+
+# Script tags and javascript: URLs, in any letter case
+_SCRIPT_RE = re.compile(r'<script|javascript:', re.IGNORECASE)
+# Everything the dialog-message validator looks for, as one alternation so a
+# single left-to-right pass finds them all
+_MESSAGE_SCAN_RE = re.compile(
+    r'(?P<script><script|javascript:)|(?P<lt><)|(?P<gt>>)|(?P<ctrl>[\x00-\x08\x0b\x0c\x0e-\x1f])',
+    re.IGNORECASE,
+)
+_MESSAGE_FLAGS = frozenset(('script', 'lt', 'gt', 'ctrl'))
+
+def _scan_message(message):
+    """Scan message once and return which of script/lt/gt/ctrl occur in it"""
+    flags = set()
+    for match in _MESSAGE_SCAN_RE.finditer(message):
+        kind = match.lastgroup
+        flags.add(kind)
+        if kind == 'script' and match.group().startswith('<'):
+            flags.add('lt')
+        if flags == _MESSAGE_FLAGS:
+            break
+    return flags
+
+# Any RFC 3986 URL scheme (http:, file:, data:, javascript:, ...); icon names
+# never contain a colon
+_URL_SCHEME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9+.\-]*:')
+# Image formats accepted for icon files
+ALLOWED_ICON_EXTENSIONS = ('.png', '.svg', '.jpg', '.jpeg', '.gif')
+# Parent-directory components or an absolute path
+_TRAVERSAL_RE = re.compile(r'\.\.|^/')
+
+_WORD_RE = re.compile(r'\w+')
+
+@functools.lru_cache(maxsize=None)
+def _letter_script(char):
+    """Unicode script of a letter, taken from its character name (LATIN, CYRILLIC, ...)"""
+    return unicodedata.name(char, '?').split(' ', 1)[0]
+
+# Scripts whose letters pass for Latin ones (Cyrillic 'а', Greek 'ο', ...).
+# Other combinations, such as Han with Hiragana and Katakana in Japanese,
+# are ordinary text
+_HOMOGLYPH_SCRIPTS = frozenset(('CYRILLIC', 'GREEK'))
+
+# The fixtures are static, so each distinct string is analysed only once
+@functools.lru_cache(maxsize=256)
+def _mixed_script_words(text):
+    """Words passing lookalike letters off as Latin, the usual homoglyph trick
+    
+    That is Latin mixed with Cyrillic or Greek, or compatibility forms
+    (fullwidth 'ａ', mathematical '𝐚', ...) that NFKC folds back to ASCII.
+    """
+    mixed = []
+    for word in _WORD_RE.findall(text):
+        if word.isascii():
+            continue
+        # Classify the folded word: compatibility forms carry names such as
+        # FULLWIDTH LATIN or MATHEMATICAL BOLD rather than a script
+        folded = unicodedata.normalize('NFKC', word)
+        if folded.isascii():
+            mixed.append(word)
+            continue
+        scripts = {_letter_script(c) for c in folded if c.isalpha()}
+        if 'LATIN' in scripts and scripts & _HOMOGLYPH_SCRIPTS:
+            mixed.append(word)
+    return tuple(mixed)
+
+# Brand names that have no business in a polkit action_id, and wording used to
+# pass a dialog off as coming from the system itself
+SUSPICIOUS_DOMAINS = ('apple', 'microsoft', 'google', 'bank', 'paypal')
+SYSTEM_TERMS = ('system', 'administrator', 'security check', 'verification')
+
+def _keyword_pattern(keywords):
+    """Case-insensitive pattern finding every keyword occurrence, overlapping ones included"""
+    alternation = '|'.join(re.escape(keyword) for keyword in keywords)
+    return re.compile(f'(?=({alternation}))', re.IGNORECASE)
+
+def _matched_keywords(pattern, keywords, text):
+    """Keywords found in text by one pattern scan, in keyword-list order"""
+    found = {match.lower() for match in pattern.findall(text)}
+    return [keyword for keyword in keywords if keyword in found]
+
+_SUSPICIOUS_DOMAIN_RE = _keyword_pattern(SUSPICIOUS_DOMAINS)
+_SYSTEM_TERM_RE = _keyword_pattern(SYSTEM_TERMS)
+
+# Dialog validators: each takes a dialog message and returns its issues
+
+def _check_length(dialog):
+    if len(dialog.get('message', '')) > 4096:
+        return ['Message too long']
+    return []
+
+def _message_flag_issues(flags):
+    """Issues for the features _scan_message found"""
+    issues = []
+    if 'script' in flags:
+        issues.append('Script content detected')
+    if 'lt' in flags and 'gt' in flags:
+        issues.append('HTML tags detected')
+    if 'ctrl' in flags:
+        issues.append('Control characters detected')
+    return issues
+
+def _check_markup(dialog):
+    flags = _scan_message(dialog.get('message', ''))
+    flags.discard('ctrl')
+    return _message_flag_issues(flags)
+
+def _check_control_chars(dialog):
+    if _has_control_chars(dialog.get('message', '')):
+        return ['Control characters detected']
+    return []
+
+def _check_mixed_script(dialog):
+    # Words mixing scripts, e.g. a Cyrillic 'а' in "admin"
+    if _mixed_script_words(dialog.get('message', '')):
+        return ['Mixed-script words detected']
+    return []
+
+def _check_action_id_traversal(dialog):
+    action_id = dialog.get('action_id', '')
+    if '..' in action_id or '/' in action_id:
+        return ['Path traversal in action_id']
+    return []
+
+def _check_dialog(dialog):
+    """Run every dialog check, sharing one scan of the message"""
+    issues = _check_length(dialog)
+    issues += _message_flag_issues(_scan_message(dialog.get('message', '')))
+    issues += _check_mixed_script(dialog)
+    issues += _check_action_id_traversal(dialog)
+    return issues
+
+# attack_type -> the validator relevant to it; fixtures of any other attack
+# type go through the full _check_dialog
+_DIALOG_VALIDATORS = {
+    'XSS_SCRIPT_INJECTION': _check_markup,
+    'HTML_INJECTION': _check_markup,
+    'UNICODE_CONFUSION': _check_mixed_script,
+    'MESSAGE_OVERFLOW': _check_length,
+    'CONTROL_CHARACTER_INJECTION': _check_control_chars,
+    'PATH_TRAVERSAL': _check_action_id_traversal,
+}
+
+# Fields each agent message type may carry; anything else is unexpected
+_EXPECTED_FIELDS = {
+    'authorization_result': frozenset(('type', 'authorized', 'action_id')),
+    'authorization_error': frozenset(('type', 'error', 'action_id')),
+    'show_auth_dialog': frozenset(('type', 'action_id', 'message', 'icon_name', 'cookie')),
+    'heartbeat_ack': frozenset(('type',)),
+}
+_VALID_TYPES = frozenset(_EXPECTED_FIELDS)
+
+# Fields each agent message type must carry, with their JSON types
+_REQUIRED_FIELDS = {
+    'authorization_result': (('authorized', bool), ('action_id', str)),
+    'authorization_error': (('error', str),),
+}
+_TYPE_NAMES = {bool: 'boolean', str: 'string'}
+
+# Default UTF-8 size limit for UI input values; the agent itself caps
+# strings at MessageValidator::MAX_STRING_LENGTH (4096)
+MAX_INPUT_BYTES = 4096
+
+# Strings longer than this are reported as their length plus a short prefix
+REPORT_STRING_LIMIT = 256
+REPORT_PREFIX_LENGTH = 32
+
+def _abbreviate_payloads(value):
+    """Copy of a result value with oversized strings replaced by length/prefix markers"""
+    if isinstance(value, str):
+        if len(value) > REPORT_STRING_LIMIT:
+            return {'length': len(value), 'prefix': value[:REPORT_PREFIX_LENGTH]}
+        return value
+    if isinstance(value, dict):
+        return {key: _abbreviate_payloads(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_abbreviate_payloads(item) for item in value]
+    return value
+
+# Fixture id ("<category>:<name>") -> the payload that fixture feeds the
+# validators. Results refer to their fixture by id, and the report lists
+# each payload once
+_FIXTURE_REGISTRY = {}
+
+def _fixture_id(category, test_case):
+    return f"{category}:{test_case['name']}"
+
+def _register_fixtures(category, fixtures, payload_key):
+    """Add each fixture's payload to _FIXTURE_REGISTRY and return the fixtures"""
+    for test_case in fixtures:
+        _FIXTURE_REGISTRY[_fixture_id(category, test_case)] = test_case[payload_key]
+    return fixtures
+
+# Dialog contents the UI must refuse or sanitize
+_MALICIOUS_DIALOGS = _register_fixtures('dialog', (
+    {
+        'name': 'Script injection in message',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "<script>alert('XSS');</script>",
+            "icon_name": "security-high",
+            "cookie": "test_cookie"
+        },
+        'attack_type': 'XSS_SCRIPT_INJECTION'
+    },
+    {
+        'name': 'HTML injection in message',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "<img src=x onerror=alert('XSS')>",
+            "icon_name": "security-high",
+            "cookie": "test_cookie"
+        },
+        'attack_type': 'HTML_INJECTION'
+    },
+    {
+        'name': 'Unicode confusion',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "Authenticate for: аdmin (using Cyrillic 'а')",
+            "icon_name": "security-high",
+            "cookie": "test_cookie"
+        },
+        'attack_type': 'UNICODE_CONFUSION'
+    },
+    {
+        'name': 'Fullwidth letter confusion',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "Authenticate for: ａdmin (using fullwidth 'ａ')",
+            "icon_name": "security-high",
+            "cookie": "test_cookie"
+        },
+        'attack_type': 'UNICODE_CONFUSION'
+    },
+    {
+        'name': 'Mathematical letter confusion',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "Authenticate for: 𝐚dmin (using mathematical bold '𝐚')",
+            "icon_name": "security-high",
+            "cookie": "test_cookie"
+        },
+        'attack_type': 'UNICODE_CONFUSION'
+    },
+    {
+        'name': 'Deceptive system message',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.freedesktop.systemd1.manage-units",
+            "message": "System update required. Enter password to continue:",
+            "icon_name": "system-software-update",
+            "cookie": "fake_system_cookie"
+        },
+        'attack_type': 'SYSTEM_IMPERSONATION'
+    },
+    {
+        'name': 'Fake security warning',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.security.scan",
+            "message": "SECURITY BREACH DETECTED! Enter password immediately:",
+            "icon_name": "security-critical",
+            "cookie": "fake_security_cookie"
+        },
+        'attack_type': 'FAKE_SECURITY_WARNING'
+    },
+    {
+        'name': 'Oversized message',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "A" * 10000,  # Very long message
+            "icon_name": "security-high",
+            "cookie": "overflow_cookie"
+        },
+        'attack_type': 'MESSAGE_OVERFLOW'
+    },
+    {
+        'name': 'Control character injection',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.example.test",
+            "message": "Normal message\x00\x01\x02Hidden content",
+            "icon_name": "security-high",
+            "cookie": "control_char_cookie"
+        },
+        'attack_type': 'CONTROL_CHARACTER_INJECTION'
+    },
+    {
+        'name': 'Path traversal in action_id',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "../../../etc/passwd",
+            "message": "Authenticate for file access",
+            "icon_name": "security-high",
+            "cookie": "traversal_cookie"
+        },
+        'attack_type': 'PATH_TRAVERSAL'
+    },
+    {
+        'name': 'Localized message',
+        'dialog': {
+            "type": "show_auth_dialog",
+            "timestamp": 0,
+            "action_id": "org.freedesktop.packagekit.package-install",
+            "message": "Требуется аутентификация。パスワードを入力してください",
+            "icon_name": "system-software-install",
+            "cookie": "localized_cookie"
+        },
+        'attack_type': 'NONE',
+        'legitimate': True
+    }
+), 'dialog')
+
+# Forged agent responses that the UI must not trust
+_FAKE_RESPONSES = _register_fixtures('response', (
+    {
+        'name': 'Fake authorization success',
+        'response': {
+            "type": "authorization_result",
+            "authorized": True,
+            "action_id": "org.freedesktop.systemd1.manage-units",
+            "fake_field": "This shouldn't be here"
+        },
+        'expected_validation': 'Extra fields detected'
+    },
+    {
+        'name': 'Fake error with script',
+        'response': {
+            "type": "authorization_error", 
+            "error": "<script>window.location='http://evil.com'</script>",
+            "action_id": "org.example.test"
+        },
+        'expected_validation': 'Script content in error'
+    },
+    {
+        'name': 'Missing required fields',
+        'response': {
+            "type": "authorization_result"
+            # Missing action_id and authorized fields
+        },
+        'expected_validation': 'Required fields missing'
+    },
+    {
+        'name': 'Invalid message type',
+        'response': {
+            "type": "fake_message_type",
+            "malicious_data": "This is a fake response"
+        },
+        'expected_validation': 'Invalid message type'
+    },
+    {
+        'name': 'Type confusion attack',
+        'response': {
+            "type": 123,  # Wrong type
+            "authorized": "yes"  # Wrong type
+        },
+        'expected_validation': 'Type mismatch'
+    },
+    {
+        'name': 'Unhashable message type',
+        'response': {
+            "type": [],  # JSON array where a string belongs
+            "authorized": True
+        },
+        'expected_validation': 'Type mismatch'
+    }
+), 'response')
+
+# Dialogs impersonating other systems or vendors
+_SPOOFING_TESTS = _register_fixtures('spoofing', (
+    {
+        'name': 'Fake system authentication',
+        'spoofed_dialog': {
+            "type": "show_auth_dialog",
+            "action_id": "com.apple.system.authentication",  # Wrong namespace
+            "message": "macOS System Authentication Required",
+            "icon_name": "system-security",
+            "cookie": "fake_macos_cookie"
+        },
+        'attack_type': 'OS_IMPERSONATION'
+    },
+    {
+        'name': 'Fake banking authentication',
+        'spoofed_dialog': {
+            "type": "show_auth_dialog", 
+            "action_id": "com.bank.secure.login",
+            "message": "Bank of America - Security Check Required",
+            "icon_name": "bank-security",
+            "cookie": "fake_bank_cookie"
+        },
+        'attack_type': 'FINANCIAL_PHISHING'
+    },
+    {
+        'name': 'Unicode domain spoofing',
+        'spoofed_dialog': {
+            "type": "show_auth_dialog",
+            "action_id": "org.аpple.system",  # Cyrillic 'а' instead of 'a'
+            "message": "Apple System Verification",
+            "icon_name": "apple-logo",
+            "cookie": "unicode_spoof_cookie"
+        },
+        'attack_type': 'UNICODE_DOMAIN_SPOOFING'
+    },
+    {
+        'name': 'Fake software installation',
+        'spoofed_dialog': {
+            "type": "show_auth_dialog",
+            "action_id": "org.microsoft.windows.installer",
+            "message": "Windows Software Installation - Enter Administrator Password",
+            "icon_name": "windows-installer",
+            "cookie": "fake_windows_cookie"
+        },
+        'attack_type': 'SOFTWARE_INSTALLATION_SPOOF'
+    }
+), 'spoofed_dialog')
+
+# Hostile values for the dialog input fields
+_INPUT_TESTS = _register_fixtures('input', (
+    {
+        'name': 'Password field overflow',
+        'input_data': {
+            'field_type': 'password',
+            'value': 'A' * 10000,  # Very long password
+            'max_length': 256
+        },
+        'expected_behavior': 'Truncate or reject'
+    },
+    {
+        'name': 'Username with special chars',
+        'input_data': {
+            'field_type': 'username',
+            'value': 'user<script>alert(1)</script>',
+            'validation': 'alphanumeric_only'
+        },
+        'expected_behavior': 'Reject or sanitize'
+    },
+    {
+        'name': 'Binary data in text field',
+        'input_data': {
+            'field_type': 'text',
+            'value': '\x00\x01\x02\x03' + 'normal text',
+            'validation': 'text_only'
+        },
+        'expected_behavior': 'Reject or sanitize'
+    },
+    {
+        'name': 'Emoji flood',
+        'input_data': {
+            'field_type': 'comment',
+            'value': '😀' * 1000,  # Emoji flood, 4 UTF-8 bytes each
+            'max_length': 500,
+            'max_bytes': 1000
+        },
+        'expected_behavior': 'Truncate'
+    }
+), 'input_data')
+
+# Icon names trying to fake branding or reach outside the icon theme
+_BRANDING_TESTS = _register_fixtures('branding', (
+    {
+        'name': 'Fake system icon',
+        'dialog_data': {
+            'icon_name': '/usr/share/icons/fake-system-security.png',
+            'action_id': 'com.malware.fake.action'
+        },
+        'attack_type': 'ICON_SPOOFING'
+    },
+    {
+        'name': 'Path traversal in icon',
+        'dialog_data': {
+            'icon_name': '../../../etc/passwd',
+            'action_id': 'org.example.test'
+        },
+        'attack_type': 'PATH_TRAVERSAL'
+    },
+    {
+        'name': 'URL as icon path',
+        'dialog_data': {
+            'icon_name': 'http://evil.com/fake_icon.png',
+            'action_id': 'org.example.test'
+        },
+        'attack_type': 'REMOTE_ICON_FETCH'
+    },
+    {
+        'name': 'Oversized icon path',
+        'dialog_data': {
+            'icon_name': 'A' * 5000,
+            'action_id': 'org.example.test'
+        },
+        'attack_type': 'PATH_OVERFLOW'
+    }
+), 'dialog_data')
+
 class UIConfusionTester:
     def __init__(self, socket_path="/tmp/quickshell-polkit-agent"):
         self.socket_path = socket_path
         self.test_results = []
         self.failures = 0
-        
-    def create_fake_dialog_message(self, message_type, **kwargs):
-        """Create a fake dialog message that could confuse the UI"""
-        return {
-            "type": message_type,
-            "timestamp": int(time.time() * 1000),
-            **kwargs
-        }
+        self.fail_fast = os.environ.get("QPA_FAIL_FAST") == "1"
         
     def test_malicious_dialog_content(self):
         """Test protection against malicious dialog content"""
         print("🎭 Testing malicious dialog content protection...")
         
-        # Test various types of malicious dialog content
-        malicious_dialogs = [
-            {
-                'name': 'Script injection in message',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="org.example.test",
-                    message="<script>alert('XSS');</script>",
-                    icon_name="security-high",
-                    cookie="test_cookie"
-                ),
-                'attack_type': 'XSS_SCRIPT_INJECTION'
-            },
-            {
-                'name': 'HTML injection in message',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog", 
-                    action_id="org.example.test",
-                    message="<img src=x onerror=alert('XSS')>",
-                    icon_name="security-high",
-                    cookie="test_cookie"
-                ),
-                'attack_type': 'HTML_INJECTION'
-            },
-            {
-                'name': 'Unicode confusion',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="org.example.test",
-                    message="Authenticate for: аdmin (using Cyrillic 'а')",
-                    icon_name="security-high", 
-                    cookie="test_cookie"
-                ),
-                'attack_type': 'UNICODE_CONFUSION'
-            },
-            {
-                'name': 'Deceptive system message',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="org.freedesktop.systemd1.manage-units",
-                    message="System update required. Enter password to continue:",
-                    icon_name="system-software-update",
-                    cookie="fake_system_cookie"
-                ),
-                'attack_type': 'SYSTEM_IMPERSONATION'
-            },
-            {
-                'name': 'Fake security warning',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="org.example.security.scan", 
-                    message="SECURITY BREACH DETECTED! Enter password immediately:",
-                    icon_name="security-critical",
-                    cookie="fake_security_cookie"
-                ),
-                'attack_type': 'FAKE_SECURITY_WARNING'
-            },
-            {
-                'name': 'Oversized message',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="org.example.test",
-                    message="A" * 10000,  # Very long message
-                    icon_name="security-high",
-                    cookie="overflow_cookie"
-                ),
-                'attack_type': 'MESSAGE_OVERFLOW'
-            },
-            {
-                'name': 'Control character injection',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="org.example.test",
-                    message="Normal message\x00\x01\x02Hidden content",
-                    icon_name="security-high",
-                    cookie="control_char_cookie"
-                ),
-                'attack_type': 'CONTROL_CHARACTER_INJECTION'
-            },
-            {
-                'name': 'Path traversal in action_id',
-                'dialog': self.create_fake_dialog_message(
-                    "show_auth_dialog",
-                    action_id="../../../etc/passwd",
-                    message="Authenticate for file access",
-                    icon_name="security-high",
-                    cookie="traversal_cookie"
-                ),
-                'attack_type': 'PATH_TRAVERSAL'
-            }
-        ]
-        
-        for test_case in malicious_dialogs:
+        for test_case in _MALICIOUS_DIALOGS:
             try:
                 # Validate dialog message structure
                 dialog = test_case['dialog']
                 
-                # Check for basic validation that should catch malicious content
-                validation_issues = []
-                
-                # Check message length
-                if len(dialog.get('message', '')) > 4096:
-                    validation_issues.append('Message too long')
-                    
-                # Check for script content
-                message = dialog.get('message', '')
-                if '<script>' in message.lower() or 'javascript:' in message.lower():
-                    validation_issues.append('Script content detected')
-                    
-                # Check for HTML tags
-                if '<' in message and '>' in message:
-                    validation_issues.append('HTML tags detected')
-                    
-                # Check for control characters
-                if any(ord(c) < 32 and c not in '\t\n\r' for c in message):
-                    validation_issues.append('Control characters detected')
-                    
-                # Check action_id for path traversal
-                action_id = dialog.get('action_id', '')
-                if '..' in action_id or '/' in action_id:
-                    validation_issues.append('Path traversal in action_id')
+                # Only the checks relevant to the declared attack type run
+                validator = _DIALOG_VALIDATORS.get(test_case['attack_type'], _check_dialog)
+                validation_issues = validator(dialog)
                     
                 result = {
                     'test': test_case['name'],
                     'attack_type': test_case['attack_type'],
-                    'dialog_data': dialog,
+                    'fixture_id': _fixture_id('dialog', test_case),
                     'validation_issues': validation_issues,
                     'should_be_blocked': len(validation_issues) > 0,
                     'status': 'BLOCKED' if validation_issues else 'ALLOWED'
                 }
                 
+                # Legitimate dialogs must get through untouched
+                if test_case.get('legitimate'):
+                    result['status'] = 'FALSE_POSITIVE' if validation_issues else 'PASS'
+                    if validation_issues:
+                        self.failures += 1
+                        
                 # Determine if this is a security issue
                 if test_case['attack_type'] in ['XSS_SCRIPT_INJECTION', 'HTML_INJECTION', 'CONTROL_CHARACTER_INJECTION', 'PATH_TRAVERSAL']:
                     if not validation_issues:
@@ -188,54 +603,7 @@ class UIConfusionTester:
         """Test detection of fake agent responses"""
         print("🤖 Testing fake agent response detection...")
         
-        # Simulate various fake responses that might confuse the UI
-        fake_responses = [
-            {
-                'name': 'Fake authorization success',
-                'response': {
-                    "type": "authorization_result",
-                    "authorized": True,
-                    "action_id": "org.freedesktop.systemd1.manage-units",
-                    "fake_field": "This shouldn't be here"
-                },
-                'expected_validation': 'Extra fields detected'
-            },
-            {
-                'name': 'Fake error with script',
-                'response': {
-                    "type": "authorization_error", 
-                    "error": "<script>window.location='http://evil.com'</script>",
-                    "action_id": "org.example.test"
-                },
-                'expected_validation': 'Script content in error'
-            },
-            {
-                'name': 'Missing required fields',
-                'response': {
-                    "type": "authorization_result"
-                    # Missing action_id and authorized fields
-                },
-                'expected_validation': 'Required fields missing'
-            },
-            {
-                'name': 'Invalid message type',
-                'response': {
-                    "type": "fake_message_type",
-                    "malicious_data": "This is a fake response"
-                },
-                'expected_validation': 'Invalid message type'
-            },
-            {
-                'name': 'Type confusion attack',
-                'response': {
-                    "type": 123,  # Wrong type
-                    "authorized": "yes"  # Wrong type
-                },
-                'expected_validation': 'Type mismatch'
-            }
-        ]
-        
-        for test_case in fake_responses:
+        for test_case in _FAKE_RESPONSES:
             try:
                 response = test_case['response']
                 
@@ -244,47 +612,34 @@ class UIConfusionTester:
                 
                 # Check message type
                 msg_type = response.get('type')
-                valid_types = ['authorization_result', 'authorization_error', 'show_auth_dialog', 'heartbeat_ack']
-                
                 if not isinstance(msg_type, str):
                     validation_issues.append('Message type not string')
-                elif msg_type not in valid_types:
+                    # Forged types may be unhashable (lists, objects); only a
+                    # string type is ever used as a schema key below
+                    msg_type = None
+                elif msg_type not in _VALID_TYPES:
                     validation_issues.append('Invalid message type')
                     
-                # Check for required fields based on type
-                if msg_type == 'authorization_result':
-                    if 'authorized' not in response:
-                        validation_issues.append('Missing authorized field')
-                    elif not isinstance(response.get('authorized'), bool):
-                        validation_issues.append('Authorized field not boolean')
+                # Check required fields and their types against the schema
+                for field, field_type in _REQUIRED_FIELDS.get(msg_type, ()):
+                    if field not in response:
+                        validation_issues.append(f'Missing {field} field')
+                    elif not isinstance(response[field], field_type):
+                        validation_issues.append(f'{field.capitalize()} field not {_TYPE_NAMES[field_type]}')
                         
-                    if 'action_id' not in response:
-                        validation_issues.append('Missing action_id field')
-                        
-                elif msg_type == 'authorization_error':
-                    if 'error' not in response:
-                        validation_issues.append('Missing error field')
-                    else:
-                        error_msg = response.get('error', '')
-                        if '<script>' in error_msg.lower():
-                            validation_issues.append('Script content in error')
+                if msg_type == 'authorization_error':
+                    error_msg = response.get('error')
+                    if isinstance(error_msg, str) and _SCRIPT_RE.search(error_msg):
+                        validation_issues.append('Script content in error')
                             
                 # Check for unexpected fields
-                expected_fields = {
-                    'authorization_result': ['type', 'authorized', 'action_id'],
-                    'authorization_error': ['type', 'error', 'action_id'], 
-                    'show_auth_dialog': ['type', 'action_id', 'message', 'icon_name', 'cookie'],
-                    'heartbeat_ack': ['type']
-                }
-                
-                if msg_type in expected_fields:
-                    for field in response:
-                        if field not in expected_fields[msg_type]:
-                            validation_issues.append(f'Unexpected field: {field}')
+                if msg_type in _EXPECTED_FIELDS:
+                    unexpected = response.keys() - _EXPECTED_FIELDS[msg_type]
+                    validation_issues.extend(f'Unexpected field: {field}' for field in sorted(unexpected))
                             
                 result = {
                     'test': test_case['name'],
-                    'fake_response': response,
+                    'fixture_id': _fixture_id('response', test_case),
                     'validation_issues': validation_issues,
                     'expected_validation': test_case['expected_validation'],
                     'properly_validated': len(validation_issues) > 0,
@@ -310,54 +665,7 @@ class UIConfusionTester:
         """Test protection against dialog spoofing"""
         print("📱 Testing dialog spoofing protection...")
         
-        spoofing_tests = [
-            {
-                'name': 'Fake system authentication',
-                'spoofed_dialog': {
-                    "type": "show_auth_dialog",
-                    "action_id": "com.apple.system.authentication",  # Wrong namespace
-                    "message": "macOS System Authentication Required",
-                    "icon_name": "system-security",
-                    "cookie": "fake_macos_cookie"
-                },
-                'attack_type': 'OS_IMPERSONATION'
-            },
-            {
-                'name': 'Fake banking authentication',
-                'spoofed_dialog': {
-                    "type": "show_auth_dialog", 
-                    "action_id": "com.bank.secure.login",
-                    "message": "Bank of America - Security Check Required",
-                    "icon_name": "bank-security",
-                    "cookie": "fake_bank_cookie"
-                },
-                'attack_type': 'FINANCIAL_PHISHING'
-            },
-            {
-                'name': 'Unicode domain spoofing',
-                'spoofed_dialog': {
-                    "type": "show_auth_dialog",
-                    "action_id": "org.аpple.system",  # Cyrillic 'а' instead of 'a'
-                    "message": "Apple System Verification",
-                    "icon_name": "apple-logo",
-                    "cookie": "unicode_spoof_cookie"
-                },
-                'attack_type': 'UNICODE_DOMAIN_SPOOFING'
-            },
-            {
-                'name': 'Fake software installation',
-                'spoofed_dialog': {
-                    "type": "show_auth_dialog",
-                    "action_id": "org.microsoft.windows.installer",
-                    "message": "Windows Software Installation - Enter Administrator Password",
-                    "icon_name": "windows-installer",
-                    "cookie": "fake_windows_cookie"
-                },
-                'attack_type': 'SOFTWARE_INSTALLATION_SPOOF'
-            }
-        ]
-        
-        for test_case in spoofing_tests:
+        for test_case in _SPOOFING_TESTS:
             try:
                 dialog = test_case['spoofed_dialog']
                 
@@ -368,20 +676,19 @@ class UIConfusionTester:
                 message = dialog.get('message', '')
                 
                 # Check for suspicious action_id patterns
-                suspicious_domains = ['apple', 'microsoft', 'google', 'bank', 'paypal']
-                for domain in suspicious_domains:
-                    if domain.lower() in action_id.lower():
-                        spoofing_indicators.append(f'Suspicious domain reference: {domain}')
+                for domain in _matched_keywords(_SUSPICIOUS_DOMAIN_RE, SUSPICIOUS_DOMAINS, action_id):
+                    spoofing_indicators.append(f'Suspicious domain reference: {domain}')
                         
-                # Check for Unicode spoofing
-                if any(ord(c) > 127 for c in action_id):
+                # Check for Unicode spoofing: homoglyphs mixed into a Latin
+                # name, or any other non-ASCII text (action ids are ASCII)
+                if _mixed_script_words(action_id):
+                    spoofing_indicators.append('Mixed-script characters in action_id')
+                elif not action_id.isascii():
                     spoofing_indicators.append('Non-ASCII characters in action_id')
                     
                 # Check for misleading system references
-                system_terms = ['system', 'administrator', 'security check', 'verification']
-                for term in system_terms:
-                    if term.lower() in message.lower():
-                        spoofing_indicators.append(f'System impersonation term: {term}')
+                for term in _matched_keywords(_SYSTEM_TERM_RE, SYSTEM_TERMS, message):
+                    spoofing_indicators.append(f'System impersonation term: {term}')
                         
                 # Check action_id format (should be reverse domain notation)
                 if not action_id.startswith('org.') and not action_id.startswith('com.'):
@@ -390,7 +697,7 @@ class UIConfusionTester:
                 result = {
                     'test': test_case['name'],
                     'attack_type': test_case['attack_type'],
-                    'spoofed_dialog': dialog,
+                    'fixture_id': _fixture_id('spoofing', test_case),
                     'spoofing_indicators': spoofing_indicators,
                     'spoofing_detected': len(spoofing_indicators) > 0,
                     'status': 'DETECTED' if spoofing_indicators else 'UNDETECTED'
@@ -417,46 +724,7 @@ class UIConfusionTester:
         """Test UI input validation and sanitization"""
         print("✅ Testing UI input validation...")
         
-        input_tests = [
-            {
-                'name': 'Password field overflow',
-                'input_data': {
-                    'field_type': 'password',
-                    'value': 'A' * 10000,  # Very long password
-                    'max_length': 256
-                },
-                'expected_behavior': 'Truncate or reject'
-            },
-            {
-                'name': 'Username with special chars',
-                'input_data': {
-                    'field_type': 'username',
-                    'value': 'user<script>alert(1)</script>',
-                    'validation': 'alphanumeric_only'
-                },
-                'expected_behavior': 'Reject or sanitize'
-            },
-            {
-                'name': 'Binary data in text field',
-                'input_data': {
-                    'field_type': 'text',
-                    'value': '\x00\x01\x02\x03' + 'normal text',
-                    'validation': 'text_only'
-                },
-                'expected_behavior': 'Reject or sanitize'
-            },
-            {
-                'name': 'Emoji flood',
-                'input_data': {
-                    'field_type': 'comment',
-                    'value': '😀' * 1000,  # Emoji flood
-                    'max_length': 500
-                },
-                'expected_behavior': 'Truncate'
-            }
-        ]
-        
-        for test_case in input_tests:
+        for test_case in _INPUT_TESTS:
             try:
                 input_data = test_case['input_data']
                 
@@ -471,6 +739,11 @@ class UIConfusionTester:
                 if len(value) > max_length:
                     validation_results.append('Length exceeded')
                     
+                # Size on the wire: code points understate multi-byte text
+                max_bytes = input_data.get('max_bytes', MAX_INPUT_BYTES)
+                if len(value.encode('utf-8')) > max_bytes:
+                    validation_results.append('Byte length exceeded')
+                    
                 # Content validation
                 if field_type == 'password':
                     # Password should allow most characters but have length limits
@@ -484,16 +757,16 @@ class UIConfusionTester:
                         
                 elif field_type == 'text':
                     # Text should not contain control characters
-                    if any(ord(c) < 32 and c not in '\t\n\r' for c in value):
+                    if _has_control_chars(value):
                         validation_results.append('Control characters detected')
                         
                 # Check for potential XSS
-                if '<script>' in value.lower() or 'javascript:' in value.lower():
+                if _SCRIPT_RE.search(value):
                     validation_results.append('Script content detected')
                     
                 result = {
                     'test': test_case['name'],
-                    'input_data': input_data,
+                    'fixture_id': _fixture_id('input', test_case),
                     'validation_results': validation_results,
                     'input_rejected': len(validation_results) > 0,
                     'expected_behavior': test_case['expected_behavior'],
@@ -520,42 +793,7 @@ class UIConfusionTester:
         """Test validation of icons and branding elements"""
         print("🎨 Testing icon and branding validation...")
         
-        branding_tests = [
-            {
-                'name': 'Fake system icon',
-                'dialog_data': {
-                    'icon_name': '/usr/share/icons/fake-system-security.png',
-                    'action_id': 'com.malware.fake.action'
-                },
-                'attack_type': 'ICON_SPOOFING'
-            },
-            {
-                'name': 'Path traversal in icon',
-                'dialog_data': {
-                    'icon_name': '../../../etc/passwd',
-                    'action_id': 'org.example.test'
-                },
-                'attack_type': 'PATH_TRAVERSAL'
-            },
-            {
-                'name': 'URL as icon path',
-                'dialog_data': {
-                    'icon_name': 'http://evil.com/fake_icon.png',
-                    'action_id': 'org.example.test'
-                },
-                'attack_type': 'REMOTE_ICON_FETCH'
-            },
-            {
-                'name': 'Oversized icon path',
-                'dialog_data': {
-                    'icon_name': 'A' * 5000,
-                    'action_id': 'org.example.test'
-                },
-                'attack_type': 'PATH_OVERFLOW'
-            }
-        ]
-        
-        for test_case in branding_tests:
+        for test_case in _BRANDING_TESTS:
             try:
                 dialog_data = test_case['dialog_data']
                 icon_name = dialog_data.get('icon_name', '')
@@ -568,16 +806,15 @@ class UIConfusionTester:
                     validation_issues.append('Icon path too long')
                     
                 # Check for path traversal
-                if '..' in icon_name or icon_name.startswith('/'):
+                if _TRAVERSAL_RE.search(icon_name):
                     validation_issues.append('Path traversal in icon name')
                     
                 # Check for URL schemes
-                if icon_name.startswith(('http://', 'https://', 'ftp://', 'file://')):
+                if _URL_SCHEME_RE.match(icon_name):
                     validation_issues.append('URL scheme in icon name')
                     
                 # Check for allowed icon formats
-                allowed_extensions = ['.png', '.svg', '.jpg', '.jpeg', '.gif']
-                if not any(icon_name.lower().endswith(ext) for ext in allowed_extensions):
+                if not icon_name.lower().endswith(ALLOWED_ICON_EXTENSIONS):
                     # If it's not a standard icon name and doesn't have extension
                     if '/' in icon_name or '\\' in icon_name:
                         validation_issues.append('Invalid icon format')
@@ -585,7 +822,7 @@ class UIConfusionTester:
                 result = {
                     'test': test_case['name'],
                     'attack_type': test_case['attack_type'],
-                    'icon_name': icon_name,
+                    'fixture_id': _fixture_id('branding', test_case),
                     'validation_issues': validation_issues,
                     'icon_blocked': len(validation_issues) > 0,
                     'status': 'BLOCKED' if validation_issues else 'ALLOWED'
@@ -612,18 +849,28 @@ class UIConfusionTester:
         """Run all UI confusion security tests"""
         print("🎪 Starting UI Confusion Attack Security Tests...")
         
-        self.test_malicious_dialog_content()
-        self.test_fake_agent_responses()
-        self.test_dialog_spoofing_protection()
-        self.test_ui_input_validation()
-        self.test_icon_and_branding_validation()
+        tests = [
+            self.test_malicious_dialog_content,
+            self.test_fake_agent_responses,
+            self.test_dialog_spoofing_protection,
+            self.test_ui_input_validation,
+            self.test_icon_and_branding_validation
+        ]
+        
+        for test in tests:
+            test()
+            if self.failures and self.fail_fast:
+                print("   ⏹️  Stopping early (QPA_FAIL_FAST)")
+                break
         
     def generate_report(self):
         """Generate detailed test report"""
         total_tests = len(self.test_results)
-        passed_tests = sum(1 for r in self.test_results if r['status'] in ['PASS', 'BLOCKED', 'DETECTED', 'VALIDATED'])
-        vulnerable_tests = sum(1 for r in self.test_results if r['status'] == 'VULNERABLE')
-        error_tests = sum(1 for r in self.test_results if r['status'] == 'ERROR')
+        counts = Counter(r['status'] for r in self.test_results)
+        passed_tests = counts['PASS'] + counts['BLOCKED'] + counts['DETECTED'] + counts['VALIDATED']
+        vulnerable_tests = counts['VULNERABLE']
+        false_positive_tests = counts['FALSE_POSITIVE']
+        error_tests = counts['ERROR']
         
         report = {
             'test_type': 'UI Confusion Attack Security',
@@ -632,9 +879,11 @@ class UIConfusionTester:
                 'total_tests': total_tests,
                 'protected': passed_tests,
                 'vulnerable': vulnerable_tests,
+                'false_positives': false_positive_tests,
                 'errors': error_tests,
                 'security_score': f"{((passed_tests / max(1, total_tests)) * 100):.1f}%"
             },
+            'fixtures': _abbreviate_payloads(_FIXTURE_REGISTRY),
             'results': self.test_results
         }
         
@@ -642,19 +891,19 @@ class UIConfusionTester:
         report_dir = Path("tests/security/reports")
         report_dir.mkdir(parents=True, exist_ok=True)
         
-        with open(report_dir / "ui_confusion_report.json", "w") as f:
-            json.dump(report, f, indent=2)
+        write_json_report(report_dir / "ui_confusion_report.json", report)
             
         # Print summary
         print(f"\n📊 UI Confusion Security Test Summary:")
         print(f"   Total tests: {total_tests}")
         print(f"   Protected: {passed_tests}")
         print(f"   Vulnerable: {vulnerable_tests}")
+        print(f"   False positives: {false_positive_tests}")
         print(f"   Errors: {error_tests}")
         print(f"   Security Score: {((passed_tests / max(1, total_tests)) * 100):.1f}%")
         
-        if vulnerable_tests > 0 or error_tests > 0:
-            print(f"   ❌ {vulnerable_tests + error_tests} UI security issues found")
+        if vulnerable_tests > 0 or false_positive_tests > 0 or error_tests > 0:
+            print(f"   ❌ {vulnerable_tests + false_positive_tests + error_tests} UI security issues found")
             return False
         else:
             print(f"   ✅ All UI confusion tests passed")